@@ -0,0 +1,57 @@
+# network latency of the eager, TorchScript and ONNX Runtime backends. the
+# exported files are written to a temporary directory, run from the project root:
+#   python -m benchmarks.backends
+import argparse
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import torch
+
+from src import export
+from src.body import Body
+from src.hand import Hand
+
+
+def latency(model, data, repeat):
+    with torch.no_grad():
+        model(data)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(data)
+            times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--body-size', type=int, nargs=2, default=[184, 248], help='input height width')
+    parser.add_argument('--hand-size', type=int, nargs=2, default=[368, 368], help='input height width')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    print('%-6s %-12s %10s %10s %10s' % ('model', 'backend', 'mean ms', 'min ms', 'max diff'))
+    with tempfile.TemporaryDirectory() as out_dir:
+        for network, cls, model_path, size in [('body', Body, args.body_model, args.body_size),
+                                               ('hand', Hand, args.hand_model, args.hand_size)]:
+            script_path, onnx_path = export.export(network, model_path, out_dir)
+            data = torch.rand((1, 3, size[0], size[1])) - 0.5
+            if torch.cuda.is_available():
+                data = data.cuda()
+            reference = None
+            for backend, path in [('eager', model_path), ('torchscript', script_path), ('onnx', onnx_path)]:
+                model = cls(path, backend=backend).model
+                times = latency(model, data, args.repeat)
+                with torch.no_grad():
+                    outputs = model(data)
+                outputs = [output.cpu() for output in (outputs if isinstance(outputs, tuple) else (outputs,))]
+                reference = reference or outputs
+                diff = max(float((output - ref).abs().max()) for output, ref in zip(outputs, reference))
+                print('%-6s %-12s %10.2f %10.2f %10.2e' % (network, backend, times.mean(), times.min(), diff))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+# helpers shared by the benchmark scripts
+
+
+# result of estimation(oriImg) and its mean time over repeat runs after a warm up run
+def timed(estimation, oriImg, repeat):
+    result = estimation(oriImg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        estimation(oriImg)
+    return result, (time.perf_counter() - start) / repeat
+
+# keypoints of every person as part -> list of (x, y)
+def body_keypoints(candidate, subset):
+    keypoints = [[] for _ in range(18)]
+    for person in subset:
+        for part in range(18):
+            index = int(person[part])
+            if index != -1:
+                keypoints[part].append(candidate[index][0:2])
+    return keypoints
+
+# keypoints of a hand as part -> list of (x, y), [0, 0] is not found
+def hand_keypoints(peaks):
+    return [[] if x == 0 and y == 0 else [(x, y)] for x, y in peaks]
+
+# distance from every reference keypoint to the closest keypoint of the same part
+def keypoint_errors(reference, test):
+    errors = []
+    missed = 0
+    for ref, other in zip(reference, test):
+        for x, y in ref:
+            if len(other) == 0:
+                missed += 1
+                continue
+            errors.append(min(np.hypot(x - ox, y - oy) for ox, oy in other))
+    return errors, missed
+
+# fraction of the reference keypoints found within tolerance pixels
+def agreement(reference, test, tolerance):
+    errors, missed = keypoint_errors(reference, test)
+    total = len(errors) + missed
+    if total == 0:
+        return float('nan')
+    return np.sum(np.array(errors) <= tolerance) / total
@@ -0,0 +1,51 @@
+# compares finding the peaks on maps upsampled to the image size with finding
+# them on the stride 8 network output, run from the project root:
+#   python -m benchmarks.peak_resolution
+import argparse
+import warnings
+
+import cv2
+import numpy as np
+
+from benchmarks.common import timed, body_keypoints, hand_keypoints, keypoint_errors
+from src.body import Body
+from src.hand import Hand
+
+
+def report(name, full_time, native_time, errors, missed):
+    print('%-24s %12.4f %12.4f %10.2f %10.2f %8d' % (
+        name, full_time, native_time, np.mean(errors) if errors else 0, np.max(errors) if errors else 0, missed))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--body-images', nargs='+', default=['images/ski.jpg', 'images/demo.jpg'])
+    parser.add_argument('--hand-images', nargs='+', default=['images/hand.jpg'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    body = Body(args.body_model, device_postprocess=False)
+    body_native = Body(args.body_model, device_postprocess=False, native_resolution=True)
+    print('%-24s %12s %12s %10s %10s %8s' % ('body image', 'full (s)', 'native (s)', 'mean px', 'max px', 'missed'))
+    for path in args.body_images:
+        oriImg = cv2.imread(path)  # B,G,R order
+        (candidate, subset), full_time = timed(body, oriImg, args.repeat)
+        (candidate_native, subset_native), native_time = timed(body_native, oriImg, args.repeat)
+        errors, missed = keypoint_errors(body_keypoints(candidate, subset),
+                                         body_keypoints(candidate_native, subset_native))
+        report(path, full_time, native_time, errors, missed)
+
+    hand = Hand(args.hand_model, device_postprocess=False)
+    hand_native = Hand(args.hand_model, device_postprocess=False, native_resolution=True)
+    print('%-24s %12s %12s %10s %10s %8s' % ('hand image', 'full (s)', 'native (s)', 'mean px', 'max px', 'missed'))
+    for path in args.hand_images:
+        oriImg = cv2.imread(path)  # B,G,R order
+        peaks, full_time = timed(hand, oriImg, args.repeat)
+        peaks_native, native_time = timed(hand_native, oriImg, args.repeat)
+        errors, missed = keypoint_errors(hand_keypoints(peaks), hand_keypoints(peaks_native))
+        report(path, full_time, native_time, errors, missed)
+
+if __name__ == "__main__":
+    main()
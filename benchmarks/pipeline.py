@@ -0,0 +1,295 @@
+# headless benchmark of the whole gesture pipeline of the apps: replays a video file
+# or a directory of images through the mixer (decode, preprocess, inference,
+# postprocess, (hands,) draw and audio control, on the openpose Body or on the HRNet /
+# person detector path of vmc-01-mixer.py) or through the drum loop of vmc-02-drum.py
+# (marker tracking, pad drawing, hit detection, sample play and key press dispatch),
+# and prints per stage p50 / p95 / p99 latency, the throughput and the peak RSS as
+# JSON. no camera, display or audio device needed. run from the project root:
+#   python -m benchmarks.pipeline --input video.mp4 --output report.json
+#   python -m benchmarks.pipeline --input video.mp4 --pose hrnet
+#   python -m benchmarks.pipeline --input video.mp4 --app drums
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import warnings
+from collections import OrderedDict
+
+import cv2
+import imutils
+import numpy as np
+import torch
+
+from drums import HitDetector, MarkerTracker, PadLayout, load_pads
+from filters import WristVolumes
+from pipeline import Dispatcher
+from src import util
+from src.body import Body
+from src.hand import Hand
+
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# the frames of a video file or of the images of a directory (sorted by name)
+def read_frames(path):
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(image_extensions):
+                yield cv2.imread(os.path.join(path, name))
+        return
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+# seconds spent in every stage, summed over the calls of a frame
+class StageTimer(object):
+    def __init__(self):
+        self.times = OrderedDict()
+        self.frame = OrderedDict()
+
+    def __call__(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        self.frame[name] = self.frame.get(name, 0) + time.perf_counter() - start
+        return result
+
+    def end_frame(self, keep=True):
+        if keep:
+            for name, seconds in self.frame.items():
+                self.times.setdefault(name, []).append(seconds)
+        self.frame = OrderedDict()
+
+    def report(self):
+        stages = OrderedDict()
+        for name, times in self.times.items():
+            times = np.array(times) * 1000
+            stages[name] = OrderedDict([
+                ('p50_ms', float(np.percentile(times, 50))),
+                ('p95_ms', float(np.percentile(times, 95))),
+                ('p99_ms', float(np.percentile(times, 99))),
+                ('mean_ms', float(times.mean())),
+            ])
+        return stages
+
+# player standing in for MusicPlayer, counts the volume changes
+class NullPlayer(object):
+    def __init__(self, id):
+        self.id = id
+        self.volume = None
+        self.updates = 0
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.updates += 1
+
+def resize(image, scale):
+    return cv2.resize(image, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+# the mixer on the openpose Body (and Hand) keypoints, the first person sets the volumes
+class OpenPoseMixer(object):
+    right_wrist = 4
+    left_wrist = 7
+
+    def __init__(self, body, hand=None, dead_band=0.02):
+        self.body = body
+        self.hand = hand
+        self.volumes = WristVolumes(self.right_wrist, self.left_wrist, dead_band)
+        # one performer, like HRNetMixer without a detector
+        self.players = [(NullPlayer(0), NullPlayer(1))]
+
+    def __call__(self, timer, frame, timestamp):
+        body = self.body
+        multiplier = [x * body.boxsize / frame.shape[0] for x in body.scale_search]
+        outputs = []
+        for scale in multiplier:
+            imageToTest = timer('preprocess', resize, frame, scale)
+            data, padded_shape, (pad,) = timer('preprocess', body.inputs.fill, [imageToTest])
+            with torch.no_grad():
+                L1, L2 = timer('inference', body.model, data)
+            outputs.append((L1, L2, padded_shape, pad, scale))
+        candidate, subset = timer('postprocess', body.postprocess, frame.shape, outputs)
+        # the hands are estimated before anything is drawn on the frame
+        all_hand_peaks = []
+        if self.hand is not None:
+            hands = timer('hands', util.handDetect, candidate, subset, frame)
+            all_hand_peaks = timer('hands', self.hand.detect, frame, hands)
+        canvas = timer('draw', util.draw_bodypose, frame, candidate, subset)
+        for peaks in all_hand_peaks:
+            canvas = timer('draw', util.draw_handpose_by_opencv, canvas, peaks)
+        timer('audio_control', self.audio_control, candidate, subset, timestamp)
+
+    def audio_control(self, candidate, subset, timestamp):
+        if len(subset) == 0:
+            self.volumes.mute(self.players[0])
+            return
+        index = subset[0][:18].astype(int)
+        found = index >= 0
+        keypoints = np.zeros((18, 2))
+        scores = np.zeros(18)
+        keypoints[found] = candidate[index[found], :2]
+        scores[found] = candidate[index[found], 2]
+        self.volumes(keypoints, scores, timestamp, self.players[0])
+
+# the mixer of vmc-01-mixer.py: HRNet, after the person detector when there is one,
+# every performer sets the volumes of their own pair of players
+class HRNetMixer(object):
+    def __init__(self, pose, performers=2, dead_band=0.02):
+        from pose import draw_pose  # needs mmpose
+        self.pose = pose
+        self.draw_pose = draw_pose
+        performers = performers if pose.detector else 1
+        self.volumes = [WristVolumes(dead_band=dead_band) for _ in range(performers)]
+        self.players = [(NullPlayer(2 * n), NullPlayer(2 * n + 1)) for n in range(performers)]
+
+    def __call__(self, timer, frame, timestamp):
+        rgb_frame = timer('preprocess', cv2.cvtColor, frame, cv2.COLOR_BGR2RGB)
+        bboxes = None
+        if self.pose.detector is not None:
+            bboxes = timer('detect', self.pose.detect_people, frame)
+        keypoints, keypoint_scores = timer('pose', self.pose.estimate, rgb_frame, bboxes, len(self.players))
+        for person_keypoints, person_scores in zip(keypoints, keypoint_scores):
+            timer('draw', self.draw_pose, rgb_frame, person_keypoints, person_scores)
+        timer('audio_control', self.audio_control, keypoints, keypoint_scores, timestamp)
+
+    def audio_control(self, keypoints, keypoint_scores, timestamp):
+        for performer, players in enumerate(self.players):
+            if performer < len(keypoints):
+                self.volumes[performer](np.asarray(keypoints[performer], dtype=np.float64)[:, :2],
+                                        keypoint_scores[performer], timestamp, players)
+            else:
+                self.volumes[performer].mute(players)
+
+# the drum loop of vmc-02-drum.py, the hits of pads with a sample are played inline and
+# the others dispatched as key presses, both only count them
+class Drums(object):
+    def __init__(self, config):
+        self.layout = PadLayout(config["pads"], config["width"], config["height"])
+        self.tracker = MarkerTracker(config["markers"])
+        self.detector = HitDetector(self.layout)
+        self.dispatcher = Dispatcher()
+        self.sampled = {pad["name"] for pad in config["pads"] if pad.get("sample")}
+        self.hits = 0
+
+    def play(self, name, velocity):
+        self.hits += 1
+
+    def press(self, key):
+        self.hits += 1
+
+    def __call__(self, timer, frame, timestamp):
+        frame = timer('preprocess', imutils.resize, frame, self.layout.width, self.layout.height)
+        frame = timer('preprocess', cv2.flip, frame, 1)
+        sticks = timer('track', self.tracker.track, frame)
+        timer('draw', self.layout.draw, frame)
+        for index, stick in enumerate(sticks):
+            hit = timer('hits', self.detector.update, index, stick, timestamp)
+            if hit is None:
+                continue
+            pad, velocity = hit
+            if pad["name"] in self.sampled:
+                timer('play', self.play, pad["name"], velocity)
+            else:
+                timer('dispatch_submit', self.dispatcher.submit, self.press, pad["key"])
+
+# runs process(timer, frame, timestamp) on every frame, the timestamps follow fps.
+# returns the number of frames after the warm up and the seconds they took
+def run(process, frames, timer, warmup, fps=30.0):
+    count = 0
+    start = time.perf_counter() if warmup == 0 else None
+    while True:
+        frame = timer('decode', next, frames, None)
+        if frame is None:
+            timer.end_frame(keep=False)
+            break
+        process(timer, frame, count / fps)
+
+        count += 1
+        timer.end_frame(keep=count > warmup)
+        if count == warmup:
+            start = time.perf_counter()
+    if start is None:
+        return 0, 0
+    return count - warmup, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='images', help='video file or directory of images')
+    parser.add_argument('--app', default='mixer', choices=['mixer', 'drums'])
+    parser.add_argument('--pose', default='openpose', choices=['openpose', 'hrnet'],
+                        help="the mixer's pose model, 'hrnet' needs mmpose")
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--preset', default='realtime')
+    parser.add_argument('--backend', default='eager', help="'eager', 'torchscript' or 'onnx'")
+    parser.add_argument('--quantized', action='store_true')
+    parser.add_argument('--native-resolution', action='store_true')
+    parser.add_argument('--hands', action='store_true', help='also estimate the hands')
+    parser.add_argument('--pose-config', default='td-hm_hrnet-w48_8xb32-210e_coco-256x192.py')
+    parser.add_argument('--pose-checkpoint', default='td-hm_hrnet-w48_8xb32-210e_coco-256x192-0e67c616_20220913.pth')
+    parser.add_argument('--det-config', help='mmdet person detector config for --pose hrnet')
+    parser.add_argument('--det-checkpoint', help='mmdet person detector checkpoint')
+    parser.add_argument('--performers', type=int, default=2, help='performers with a person detector')
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu',
+                        help='device of --pose hrnet')
+    parser.add_argument('--pads', default='drum_pads.json', help='pad layout of --app drums')
+    parser.add_argument('--fps', type=float, default=30.0, help='frame rate the timestamps follow')
+    parser.add_argument('--warmup', type=int, default=1, help='first frames left out of the report')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    if args.app == 'drums':
+        process = Drums(load_pads(args.pads))
+        settings = [('app', args.app), ('pads', args.pads)]
+    elif args.pose == 'hrnet':
+        from pose import TopDownPose
+        process = HRNetMixer(TopDownPose(args.pose_config, args.pose_checkpoint, args.device,
+                                         args.det_config, args.det_checkpoint), args.performers)
+        settings = [('app', args.app), ('pose', args.pose), ('detector', args.det_config),
+                    ('performers', len(process.players)), ('device', args.device)]
+    else:
+        body = Body(args.body_model, args.preset, backend=args.backend, quantized=args.quantized,
+                    native_resolution=args.native_resolution)
+        hand = Hand(args.hand_model, args.preset, backend=args.backend, quantized=args.quantized,
+                    native_resolution=args.native_resolution) if args.hands else None
+        process = OpenPoseMixer(body, hand)
+        settings = [('app', args.app), ('pose', args.pose), ('preset', args.preset), ('backend', args.backend),
+                    ('quantized', args.quantized), ('native_resolution', args.native_resolution),
+                    ('hands', args.hands), ('device', str(body.device))]
+    timer = StageTimer()
+    frames, seconds = run(process, read_frames(args.input), timer, args.warmup, args.fps)
+
+    report = OrderedDict([
+        ('input', args.input),
+        ('settings', OrderedDict(settings)),
+        ('frames', frames),
+        ('throughput_fps', frames / seconds if seconds else 0),
+        ('stages', timer.report()),
+    ])
+    if args.app == 'drums':
+        process.dispatcher.close(timeout=1)
+        report['hits'] = process.hits
+        report['dispatcher'] = process.dispatcher.stats()
+    else:
+        report['volume_updates'] = sum(player.updates for players in process.players for player in players)
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
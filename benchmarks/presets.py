@@ -0,0 +1,43 @@
+# frames per second and keypoint agreement of every Body and Hand preset on the
+# bundled images, the 'accurate' preset is the reference. run from the project root:
+#   python -m benchmarks.presets
+import argparse
+import warnings
+
+import cv2
+
+from benchmarks.common import timed, body_keypoints, hand_keypoints, agreement
+from src import body
+from src import hand
+
+
+def table(title, estimations, images, keypoints, repeat, tolerance):
+    print('%-10s %-24s %10s %10s' % (title, 'image', 'fps', 'agreement'))
+    reference = {}
+    for path in images:
+        reference[path] = keypoints(estimations['accurate'](cv2.imread(path)))
+    for preset, estimation in estimations.items():
+        for path in images:
+            oriImg = cv2.imread(path)  # B,G,R order
+            result, seconds = timed(estimation, oriImg, repeat)
+            print('%-10s %-24s %10.2f %10.2f' % (
+                preset, path, 1 / seconds, agreement(reference[path], keypoints(result), tolerance)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--body-images', nargs='+', default=['images/ski.jpg', 'images/demo.jpg'])
+    parser.add_argument('--hand-images', nargs='+', default=['images/hand.jpg'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=10, help='pixels')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    bodies = {preset: body.Body(args.body_model, preset) for preset in body.presets}
+    table('body', bodies, args.body_images, lambda result: body_keypoints(*result), args.repeat, args.tolerance)
+    hands = {preset: hand.Hand(args.hand_model, preset) for preset in hand.presets}
+    table('hand', hands, args.hand_images, hand_keypoints, args.repeat, args.tolerance)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# per stage latency and keypoint drift of the int8 quantized networks against the
+# float ones on the bundled images, run from the project root:
+#   python -m benchmarks.quantization
+import argparse
+import time
+import warnings
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import torch
+
+from benchmarks.common import timed, body_keypoints, hand_keypoints, keypoint_errors
+from src.body import Body
+from src.hand import Hand
+
+
+# mean milliseconds spent in every block (model0, model1_1, ...) of the network
+def stage_latency(model, data, repeat):
+    times = OrderedDict()
+    starts = {}
+
+    def start(name):
+        def hook(module, inputs):
+            starts[name] = time.perf_counter()
+        return hook
+
+    def stop(name):
+        def hook(module, inputs, output):
+            times[name] = times.get(name, 0) + time.perf_counter() - starts[name]
+        return hook
+
+    handles = []
+    for name, block in model.named_children():
+        handles.append(block.register_forward_pre_hook(start(name)))
+        handles.append(block.register_forward_hook(stop(name)))
+    with torch.no_grad():
+        model(data)
+        times.clear()
+        for _ in range(repeat):
+            model(data)
+    for handle in handles:
+        handle.remove()
+    return OrderedDict((name, seconds * 1000 / repeat) for name, seconds in times.items())
+
+def report_stages(network, float_model, int8_model, size, repeat):
+    data = torch.rand((1, 3, size[0], size[1])) - 0.5
+    float_times = stage_latency(float_model, data.to(next(float_model.parameters()).device), repeat)
+    int8_times = stage_latency(int8_model, data, repeat)
+    print('%-6s %-10s %10s %10s %8s' % (network, 'stage', 'float ms', 'int8 ms', 'speedup'))
+    for name in float_times:
+        print('%-6s %-10s %10.2f %10.2f %8.2f' % (
+            network, name, float_times[name], int8_times[name], float_times[name] / int8_times[name]))
+    print('%-6s %-10s %10.2f %10.2f %8.2f' % (
+        network, 'total', sum(float_times.values()), sum(int8_times.values()),
+        sum(float_times.values()) / sum(int8_times.values())))
+
+def report_drift(title, estimation, quantized, images, keypoints, repeat):
+    print('%-24s %10s %10s %10s %10s %8s' % (title, 'float s', 'int8 s', 'mean px', 'max px', 'missed'))
+    for path in images:
+        oriImg = cv2.imread(path)  # B,G,R order
+        result, float_time = timed(estimation, oriImg, repeat)
+        result_int8, int8_time = timed(quantized, oriImg, repeat)
+        errors, missed = keypoint_errors(keypoints(result), keypoints(result_int8))
+        print('%-24s %10.4f %10.4f %10.2f %10.2f %8d' % (
+            path, float_time, int8_time, np.mean(errors) if errors else 0, np.max(errors) if errors else 0, missed))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--body-images', nargs='+', default=['images/ski.jpg', 'images/demo.jpg'])
+    parser.add_argument('--hand-images', nargs='+', default=['images/hand.jpg'])
+    parser.add_argument('--body-size', type=int, nargs=2, default=[184, 248], help='input height width')
+    parser.add_argument('--hand-size', type=int, nargs=2, default=[368, 368], help='input height width')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    body = Body(args.body_model)
+    body_int8 = Body(args.body_model, quantized=True)
+    report_stages('body', body.model, body_int8.model, args.body_size, args.repeat)
+    report_drift('body image', body, body_int8, args.body_images, lambda result: body_keypoints(*result), args.repeat)
+
+    hand = Hand(args.hand_model)
+    hand_int8 = Hand(args.hand_model, quantized=True)
+    report_stages('hand', hand.model, hand_int8.model, args.hand_size, args.repeat)
+    report_drift('hand image', hand, hand_int8, args.hand_images, hand_keypoints, args.repeat)
+
+if __name__ == "__main__":
+    main()
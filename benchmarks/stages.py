@@ -0,0 +1,43 @@
+# frames per second and keypoint agreement of Body and Hand stopping the network
+# after 1 to 6 stages on the bundled images, all 6 stages is the reference.
+# run from the project root:
+#   python -m benchmarks.stages
+import argparse
+import warnings
+
+import cv2
+
+from benchmarks.common import timed, body_keypoints, hand_keypoints, agreement
+from src import body
+from src import hand
+
+
+def table(title, estimations, images, keypoints, repeat, tolerance):
+    print('%-6s %-8s %-24s %10s %10s' % (title, 'stages', 'image', 'fps', 'agreement'))
+    for path in images:
+        oriImg = cv2.imread(path)  # B,G,R order
+        reference = keypoints(estimations[6](oriImg))
+        for stages, estimation in sorted(estimations.items()):
+            result, seconds = timed(estimation, oriImg, repeat)
+            print('%-6s %-8d %-24s %10.2f %10.2f' % (
+                title, stages, path, 1 / seconds, agreement(reference, keypoints(result), tolerance)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', default='model/body_pose_model.pth')
+    parser.add_argument('--hand-model', default='model/hand_pose_model.pth')
+    parser.add_argument('--body-images', nargs='+', default=['images/ski.jpg', 'images/demo.jpg'])
+    parser.add_argument('--hand-images', nargs='+', default=['images/hand.jpg'])
+    parser.add_argument('--preset', default='realtime')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=10, help='pixels')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    bodies = {stages: body.Body(args.body_model, args.preset, stages=stages) for stages in range(1, 7)}
+    table('body', bodies, args.body_images, lambda result: body_keypoints(*result), args.repeat, args.tolerance)
+    hands = {stages: hand.Hand(args.hand_model, args.preset, stages=stages) for stages in range(1, 7)}
+    table('hand', hands, args.hand_images, hand_keypoints, args.repeat, args.tolerance)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import json
+
+import cv2
+import numpy as np
+
+
+# drum pads and sticks of vmc-02-drum.py, defined in a json file (drum_pads.json):
+#   {"width": 900, "height": 700,
+#    "markers": [{"name": "red", "low": [h, s, v], "high": [h, s, v]}, ...],
+#    "pads": [{"name": "RIDE", "key": "7", "rect": [x1, y1, x2, y2], "color": [b, g, r],
+#              "label": [x, y], "label_color": [b, g, r], "sample": "samples/ride.wav"}, ...]}
+# the frames are resized to width x height (imutils.resize) before the pads are hit
+def load_pads(path="drum_pads.json"):
+    with open(path) as f:
+        return json.load(f)
+
+
+# the rectangle and the name of every pad drawn on image, in the colors of the pad
+# or in color / label_color when they are given
+def render_pads(image, pads, color=None, label_color=None):
+    for pad in pads:
+        x1, y1, x2, y2 = pad["rect"]
+        # image/frame, start_point, end_point, color, thickness
+        cv2.rectangle(image, (x1, y1), (x2, y2), pad["color"] if color is None else color, 1)
+        cv2.putText(image, pad["name"], tuple(pad["label"]), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    pad["label_color"] if label_color is None else label_color, 3, cv2.LINE_AA)
+
+
+# split a boolean mask into disjoint boxes (x1, y1, x2, y2), x2 and y2 excluded:
+# every row is cut into runs of set pixels and a run continues a box of the rows
+# above as long as they have the very same run
+def mask_boxes(mask):
+    boxes = []
+    started = {}
+    for y in range(mask.shape[0] + 1):
+        runs = set()
+        if y < mask.shape[0]:
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], mask[y].astype(np.int8), [0]))))
+            runs = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+        for x1, x2 in started.keys() - runs:
+            boxes.append((x1, started.pop((x1, x2)), x2, y))
+        for run in runs - started.keys():
+            started[run] = y
+    return boxes
+
+
+# the pads compiled for one frame size: a label image with the index + 1 of the pad
+# covering every pixel (0 for none) so a hit test is a single lookup, and the
+# rectangles and names rendered once into an overlay blended over every frame.
+# only the boxes around the rectangle edges and the names are blended, not the
+# whole frame, and opaque pads (alpha 1) are simply drawn on the frame
+class PadLayout:
+    def __init__(self, pads, width, height, alpha=1.0):
+        self.pads = pads
+        self.width = width
+        self.height = height
+        self.alpha = alpha
+
+        self.labels = np.zeros((height, width), dtype=np.uint8)
+        # a point hits a pad strictly inside its rectangle, the first pad wins
+        for index, pad in reversed(list(enumerate(pads))):
+            x1, y1, x2, y2 = pad["rect"]
+            self.labels[max(y1 + 1, 0):max(y2, 0), max(x1 + 1, 0):max(x2, 0)] = index + 1
+
+        # the overlay is rendered on black, so its anti-aliased pixels are the color
+        # premultiplied by their coverage, which is rendered alongside in white
+        overlay = np.zeros((height, width, 3), dtype=np.uint8)
+        coverage = np.zeros((height, width), dtype=np.uint8)
+        render_pads(overlay, pads)
+        render_pads(coverage, pads, 255, 255)
+        # the edges of the rectangles and the boxes of the names, to blend
+        drawn = np.zeros((height, width), dtype=bool)
+        name = np.zeros((height, width), dtype=np.uint8)
+        for pad in pads:
+            x1, y1, x2, y2 = pad["rect"]
+            for row in (y1, y2):
+                drawn[max(row, 0):max(row + 1, 0), max(x1, 0):max(x2 + 1, 0)] = True
+            for column in (x1, x2):
+                drawn[max(y1, 0):max(y2 + 1, 0), max(column, 0):max(column + 1, 0)] = True
+            name.fill(0)
+            cv2.putText(name, pad["name"], tuple(pad["label"]), cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 3, cv2.LINE_AA)
+            x, y, w, h = cv2.boundingRect(name)
+            drawn[y:y + h, x:x + w] = True
+        # frame * (255 - alpha * coverage) / 255 + alpha * overlay is what drawing on
+        # the frame itself gives, alpha < 1 makes the pads translucent
+        self.inverse = cv2.merge([255 - np.round(alpha * coverage).astype(np.uint8)] * 3)
+        self.overlay = np.round(alpha * overlay).astype(np.uint8)
+        self.boxes = [(slice(y1, y2), slice(x1, x2), self.inverse[y1:y2, x1:x2], self.overlay[y1:y2, x1:x2])
+                      for x1, y1, x2, y2 in mask_boxes(drawn)]
+
+    @staticmethod
+    def from_file(path="drum_pads.json", width=None, height=None, alpha=1.0):
+        config = load_pads(path)
+        return PadLayout(config["pads"], width or config["width"], height or config["height"], alpha)
+
+    # the pad at x, y or None
+    def hit(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        index = self.labels[y, x]
+        return self.pads[index - 1] if index else None
+
+    # blend the pads into frame in place
+    def draw(self, frame):
+        if self.alpha == 1:
+            render_pads(frame, self.pads)
+            return frame
+        cropped = frame.shape[0] < self.height or frame.shape[1] < self.width
+        for rows, columns, inverse, overlay in self.boxes:
+            target = frame[rows, columns]
+            if cropped:
+                height, width = target.shape[:2]
+                if height == 0 or width == 0:
+                    continue
+                inverse = inverse[:height, :width]
+                overlay = overlay[:height, :width]
+            cv2.add(cv2.multiply(target, inverse, scale=1 / 255), overlay, dst=target)
+        return frame
+
+
+# the largest blob of every marker color (the drum sticks), all the colors at once.
+# markers are {"name": "red", "low": [h, s, v], "high": [h, s, v]} ranges of
+# cv2.inRange on the opencv HSV values, up to 8 of them. an HSV range is a box, so
+# each channel has a 256 entry lookup table with one bit per marker whose range holds
+# the value (the ranges may overlap) and a pixel belongs to the markers whose bit is
+# set in all three. a frame is downscaled, converted to HSV and classified by one
+# cv2.LUT, then the outer contours of each marker's bit give its largest blob (by
+# contour area, like the sorted RETR_TREE contours the drum loop used)
+class MarkerTracker:
+    def __init__(self, markers, scale=0.5, min_area=0):
+        if len(markers) > 8:
+            raise ValueError("at most 8 markers are supported, got %d" % len(markers))
+        self.markers = markers
+        self.scale = scale
+        self.min_area = min_area
+
+        values = np.arange(256)
+        self.lut = np.zeros((1, 256, 3), dtype=np.uint8)
+        for bit, marker in enumerate(markers):
+            for channel in range(3):
+                inside = (values >= marker["low"][channel]) & (values <= marker["high"][channel])
+                self.lut[0, inside, channel] |= 1 << bit
+
+    # bounding rectangle (x, y, w, h) in frame coordinates of the largest blob of
+    # every marker, None for the markers that are not in frame
+    def track(self, frame):
+        small = frame
+        if self.scale != 1:
+            small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_NEAREST)
+        h, s, v = cv2.split(cv2.LUT(cv2.cvtColor(small, cv2.COLOR_BGR2HSV), self.lut))
+        bits = cv2.bitwise_and(cv2.bitwise_and(h, s), v)
+
+        boxes = []
+        for bit in range(len(self.markers)):
+            mask = cv2.bitwise_and(bits, 1 << bit)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if len(contours) == 0:
+                boxes.append(None)
+                continue
+            cnt = max(contours, key=cv2.contourArea)
+            if cv2.contourArea(cnt) < self.min_area * self.scale * self.scale:
+                boxes.append(None)
+                continue
+            boxes.append(tuple(int(round(value / self.scale)) for value in cv2.boundingRect(cnt)))
+        return boxes
+
+
+# turns the stick positions of every frame into drum hits. per stick it follows the
+# center of the blob and its velocity (exponentially smoothed, pixels per second) and
+# fires once when the stick enters a pad (its x, y as in PadLayout.hit) moving down
+# at min_speed or more or, inside a pad, when its downward velocity peaks above
+# min_speed, the bottom of a strike. a stick resting in a pad or drifting into it
+# fires nothing, and no stick fires again within refractory seconds. a stick only
+# leaves a pad after release_frames frames outside of it (or not seen), so jitter
+# across the edge of a pad or a lost frame is not a new entry.
+# the velocity of a hit is its speed scaled by max_speed, in 0 - 1
+class HitDetector:
+    def __init__(self, layout, refractory=0.1, min_speed=300.0, max_speed=3000.0, smoothing=0.5,
+                 release_frames=3):
+        self.layout = layout
+        self.refractory = refractory
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.smoothing = smoothing
+        self.release_frames = release_frames
+        self.states = {}
+
+    # box (x, y, w, h) of stick (any key, e.g. its index) or None when it is not
+    # seen, timestamp in seconds. returns (pad, velocity) for a hit, None otherwise
+    def update(self, stick, box, timestamp):
+        state = self.states.setdefault(stick, {"pad": None, "outside": 0, "center": None, "time": None,
+                                               "velocity": np.zeros(2), "armed": True, "fired": -np.inf})
+        if box is None:
+            self.leave(state)
+            state.update(center=None, time=None, velocity=np.zeros(2), armed=True)
+            return None
+
+        x, y, w, h = box
+        center = np.array([x + w / 2, y + h / 2], dtype=np.float64)
+        previous = state["velocity"]
+        velocity = np.zeros(2)
+        if state["center"] is not None:
+            dt = max(timestamp - state["time"], 1e-3)
+            velocity = (center - state["center"]) / dt
+            velocity = self.smoothing * previous + (1 - self.smoothing) * velocity
+        pad = self.layout.hit(x, y)
+
+        entered = False
+        if pad is None:
+            self.leave(state)
+        else:
+            entered = pad is not state["pad"]
+            state.update(pad=pad, outside=0)
+        entered = entered and velocity[1] >= self.min_speed
+        # y grows downwards, the peak is the first frame slower than the one before
+        peak = pad is not None and state["armed"] and previous[1] >= self.min_speed and velocity[1] < previous[1]
+        if velocity[1] < self.min_speed:
+            state["armed"] = True
+
+        hit = None
+        if (entered or peak) and timestamp - state["fired"] >= self.refractory:
+            speed = max(np.linalg.norm(velocity), np.linalg.norm(previous))
+            hit = pad, float(min(speed / self.max_speed, 1.0))
+            state["fired"] = timestamp
+            state["armed"] = False
+
+        state.update(center=center, time=timestamp, velocity=velocity)
+        return hit
+
+    # one more frame outside of the pad of state, past release_frames it is left
+    def leave(self, state):
+        state["outside"] += 1
+        if state["outside"] >= self.release_frames:
+            state["pad"] = None
@@ -0,0 +1,114 @@
+import math
+
+import numpy as np
+
+
+# One Euro filter (Casiez et al. 2012) over a K x D array of keypoints, e.g. the 17
+# COCO keypoints of a performer. every keypoint is smoothed by a low pass filter
+# whose cutoff rises with its speed: still keypoints lose their jitter, fast ones
+# keep up without lag. keypoints scored under min_score hold their last value
+# instead of pulling the estimate towards a bad detection. a keypoint is only seeded
+# by its first detection scored min_score or more, until then it is passed through
+# and seeded is False for it, so callers can ignore it
+class OneEuroFilter:
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, min_score=0.3):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.min_score = min_score
+        self.reset()
+
+    def reset(self):
+        self.points = None
+        self.speed = None
+        self.seeded = None
+        self.timestamp = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    # points K x D, scores K (None trusts every point), timestamp in seconds.
+    # returns the filtered K x D points
+    def __call__(self, points, scores=None, timestamp=None):
+        points = np.asarray(points, dtype=np.float64)
+        trusted = np.ones(len(points), dtype=bool) if scores is None else np.asarray(scores) >= self.min_score
+        if self.points is None:
+            self.points = points.copy()
+            self.speed = np.zeros_like(points)
+            self.seeded = np.zeros(len(points), dtype=bool)
+
+        dt = 1.0 / 30 if timestamp is None or self.timestamp is None else max(timestamp - self.timestamp, 1e-3)
+        self.timestamp = timestamp
+
+        speed = (points - self.points) / dt
+        speed = self.speed + self.alpha(self.d_cutoff, dt) * (speed - self.speed)
+        cutoff = self.min_cutoff + self.beta * np.linalg.norm(speed, axis=1, keepdims=True)
+        filtered = self.points + self.alpha(cutoff, dt) * (points - self.points)
+
+        update = trusted & self.seeded
+        self.points[update] = filtered[update]
+        self.speed[update] = speed[update]
+        # not seeded yet, start from the detection (the first trusted one seeds it)
+        self.points[~self.seeded] = points[~self.seeded]
+        self.speed[~self.seeded] = 0
+        self.seeded |= trusted
+        return self.points.copy()
+
+
+# passes a value on only when it moved at least threshold away from the last value
+# passed on for the same key, so sinks like MusicPlayer.set_volume are not called
+# for every bit of jitter
+class DeadBand:
+    def __init__(self, threshold=0.02):
+        self.threshold = threshold
+        self.values = {}
+
+    # True when value should be passed on, it then becomes the value of key
+    def changed(self, key, value):
+        last = self.values.get(key)
+        if last is not None and abs(value - last) < self.threshold and not (value == 0 and last != 0):
+            return False
+        self.values[key] = value
+        return True
+
+
+# the mixer's volume of a wrist at height y (pixels, growing downwards): silent
+# below 400, then louder the higher the wrist is raised
+def wrist_volume(y):
+    y = int(y)
+    return int((500 - y) / 5) / 100 if y < 400 else 0
+
+
+# the volumes of one performer's (right, left) pair of players from their keypoints.
+# the keypoints are smoothed by a OneEuroFilter, the volumes wait for the first
+# confident detection of both wrists and only reach a player (anything with an id
+# and set_volume, e.g. MusicPlayer) when they changed by dead_band or more.
+# right_wrist / left_wrist index the keypoints, 10 / 9 are the COCO wrists of HRNet
+class WristVolumes:
+    def __init__(self, right_wrist=10, left_wrist=9, dead_band=0.02, min_score=0.3):
+        self.wrists = [right_wrist, left_wrist]
+        self.filter = OneEuroFilter(min_score=min_score)
+        self.dead_band = DeadBand(dead_band)
+
+    # keypoints K x 2, scores K (None trusts every keypoint), timestamp in seconds.
+    # returns the (right, left) volumes, None while the wrists are not seeded
+    def __call__(self, keypoints, scores, timestamp, players):
+        keypoints = self.filter(keypoints, scores, timestamp)
+        if not self.filter.seeded[self.wrists].all():
+            return None
+        volumes = [wrist_volume(keypoints[wrist][1]) for wrist in self.wrists]
+        for player, volume in zip(players, volumes):
+            self.update(player, volume)
+        return volumes
+
+    # nobody is there, forget the keypoints and silence the players
+    def mute(self, players):
+        self.filter.reset()
+        for player in players:
+            self.update(player, 0)
+
+    def update(self, player, volume):
+        if self.dead_band.changed(player.id, volume):
+            player.set_volume(volume)
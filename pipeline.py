@@ -0,0 +1,142 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+# bounded queue between two stages of an app. put never blocks: when the queue is
+# full the oldest item is dropped, so a slow consumer always gets the latest frame
+# instead of working through a backlog of stale ones
+class LatestQueue:
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # waits up to timeout seconds (None forever, 0 not at all), None when nothing came
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(block=timeout != 0, timeout=timeout or None)
+        except queue.Empty:
+            return None
+
+
+# thread running one stage of a pipeline until stop_event is set. without a source
+# work() produces the items (e.g. reads the camera), otherwise work(item) is called
+# for every item of source. results that are not None are put into sink, items
+# whose work raises are logged and dropped
+class Stage(threading.Thread):
+    def __init__(self, name, work, stop_event, source=None, sink=None, timeout=0.1):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.stop_event = stop_event
+        self.source = source
+        self.sink = sink
+        self.timeout = timeout
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.source is None:
+                item = self._work()
+            else:
+                item = self.source.get(self.timeout)
+                if item is None:
+                    continue
+                item = self._work(item)
+            if item is not None and self.sink is not None:
+                self.sink.put(item)
+
+    # a failing item is logged and skipped, it must not end the stage
+    def _work(self, *item):
+        try:
+            return self.work(*item)
+        except Exception:
+            logging.exception(f"Stage {self.name} failed")
+            return None
+
+
+# runs slow outputs (key presses, events, ...) on a worker thread in the order
+# they were submitted, so the producer (the vision loop) never waits on them.
+# outputs that return at once (e.g. player.SampleEngine.play) are better called
+# inline, behind a slow output in the queue they would wait for it.
+# submit never blocks, past maxsize waiting outputs new ones are dropped and counted.
+# the time outputs waited in the queue and the time they took are kept for stats
+class Dispatcher:
+    def __init__(self, maxsize=64, name="dispatch", history=1000):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.dispatched = 0
+        self.max_depth = 0
+        self.waits = deque(maxlen=history)
+        self.durations = deque(maxlen=history)
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        try:
+            self.queue.put_nowait((time.perf_counter(), function, args))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            submitted, function, args = item
+            started = time.perf_counter()
+            try:
+                function(*args)
+            except Exception:
+                logging.exception("Dispatched output failed")
+            self.waits.append(started - submitted)
+            self.durations.append(time.perf_counter() - started)
+            self.dispatched += 1
+
+    # queue depth and milliseconds waited in the queue / spent dispatching
+    def stats(self):
+        stats = {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+        }
+        for name, times in (("wait", list(self.waits)), ("dispatch", list(self.durations))):
+            if times:
+                times = np.array(times) * 1000
+                stats[name + "_p50_ms"] = float(np.percentile(times, 50))
+                stats[name + "_p95_ms"] = float(np.percentile(times, 95))
+                stats[name + "_max_ms"] = float(times.max())
+        return stats
+
+    # dispatch what is queued and stop the worker. never blocks on a full queue: the
+    # oldest waiting outputs are dropped (and counted) to make room for the stop marker
+    def close(self, timeout=None):
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        self.thread.join(timeout)
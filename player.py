@@ -126,6 +126,11 @@ class Playlist(BaseModel):
             logging.warning("Invalid indices for moving song.")
 
 
+# MusicPlayer n plays on channel n + 1, the channels below music_channels are left
+# to them and SampleEngine allocates its voices from music_channels up
+music_channels = 16
+
+
 class MusicPlayer:
     instance_count = 0
 
@@ -138,6 +143,11 @@ class MusicPlayer:
         )
         if not pygame.mixer.get_init():
             pygame.mixer.init()
+        if self.instance_count >= music_channels:
+            logging.warning(
+                f"MusicPlayer {self.id} plays on channel {self.instance_count}, "
+                f"it is shared with the sample voices from {music_channels} up"
+            )
         self.channel = pygame.mixer.Channel(self.instance_count)
         self.playlist = playlist if playlist else Playlist()
         self.is_playing = False
@@ -269,3 +279,74 @@ class MusicPlayer:
             self.play()
 
 
+
+
+# plays short samples (drum pads) with as little latency as pygame allows. every
+# sample is decoded into memory up front and played on a pool of pre-allocated
+# channels above the MusicPlayer ones (music_channels), when every voice is busy
+# the one that started the longest ago is stolen. create it before any MusicPlayer
+# so the mixer opens with the small buffer
+class SampleEngine:
+    def __init__(self, samples=None, voices=16, frequency=44100, buffer=256):
+        if pygame.mixer.get_init():
+            logging.warning(
+                "Mixer already initialized, the sample engine keeps its buffer size"
+            )
+        else:
+            # a 256 frames buffer is ~6 ms at 44.1 kHz
+            pygame.mixer.init(frequency=frequency, size=-16, channels=2, buffer=buffer)
+        first = max(music_channels, pygame.mixer.get_num_channels())
+        pygame.mixer.set_num_channels(first + voices)
+        self.channels = [pygame.mixer.Channel(first + i) for i in range(voices)]
+        self.started = [0.0] * voices
+        self.sounds = {}
+        self.lock = threading.Lock()
+        for name, file_path in (samples or {}).items():
+            self.load(name, file_path)
+
+    @staticmethod
+    def from_pads(pads, **kwargs) -> "SampleEngine":
+        samples = {pad["name"]: pad["sample"] for pad in pads if pad.get("sample")}
+        engine = SampleEngine(samples, **kwargs)
+        # pads that name samples but play none of them are a broken kit, not a fallback
+        if samples and not engine.sounds:
+            raise FileNotFoundError(
+                f"None of the {len(samples)} pad samples could be loaded "
+                f"(e.g. {next(iter(samples.values()))}), "
+                "run python samples/make_samples.py from the project root"
+            )
+        return engine
+
+    def load(self, name, file_path):
+        if Song.from_file(file_path) is None:
+            return False
+        self.sounds[name] = pygame.mixer.Sound(file_path)
+        logging.info(f"Sample loaded: {Colors.colorize(name, Colors.YELLOW)} {file_path}")
+        return True
+
+    def __contains__(self, name):
+        return name in self.sounds
+
+    def _voice(self):
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+        # steal the oldest voice
+        return min(range(len(self.channels)), key=self.started.__getitem__)
+
+    def play(self, name, velocity=1.0):
+        sound = self.sounds.get(name)
+        if sound is None:
+            logging.warning(f"No sample for: {Colors.colorize(name, Colors.RED)}")
+            return None
+        with self.lock:
+            index = self._voice()
+            channel = self.channels[index]
+            self.started[index] = time.perf_counter()
+            channel.set_volume(velocity)
+            channel.play(sound)
+        return channel
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
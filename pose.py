@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+from mmpose.apis import init_model, inference_topdown
+from mmpose.evaluation.functional import nms
+from mmpose.structures import merge_data_samples
+
+try:
+    from mmdet.apis import inference_detector, init_detector
+    has_mmdet = True
+except (ImportError, ModuleNotFoundError):
+    has_mmdet = False
+
+
+# the top-down HRNet (mmpose) pose estimation of the mixer. with det_config /
+# det_checkpoint (an mmdet person detector, e.g. RTMDet-tiny) every detected person
+# is cropped and all the crops go through HRNet in one batch, ordered left to right.
+# without them HRNet runs on the whole frame as a single box
+class TopDownPose:
+    def __init__(self, config, checkpoint, device="cuda:0", det_config=None, det_checkpoint=None,
+                 bbox_thr=0.3, nms_thr=0.3):
+        self.model = init_model(config, checkpoint, device=device)
+        self.detector = None
+        if det_config:
+            if not has_mmdet:
+                raise ImportError("the person detector needs mmdet (pip install mmdet)")
+            self.detector = init_detector(det_config, det_checkpoint, device=device)
+        self.bbox_thr = bbox_thr
+        self.nms_thr = nms_thr
+
+    # person boxes (x1, y1, x2, y2) of the BGR frame ordered left to right
+    def detect_people(self, frame):
+        det_result = inference_detector(self.detector, frame)
+        pred_instance = det_result.pred_instances.cpu().numpy()
+        bboxes = np.concatenate((pred_instance.bboxes, pred_instance.scores[:, None]), axis=1)
+        bboxes = bboxes[np.logical_and(pred_instance.labels == 0, pred_instance.scores > self.bbox_thr)]
+        bboxes = bboxes[nms(bboxes, self.nms_thr), :4]
+        return bboxes[np.argsort(bboxes[:, 0] + bboxes[:, 2])]
+
+    # keypoints (N x 17 x 2) and keypoint scores (N x 17) of at most max_people people
+    # in rgb_frame, inside bboxes (None is the whole frame)
+    def estimate(self, rgb_frame, bboxes=None, max_people=None):
+        if bboxes is not None and len(bboxes) == 0:
+            return np.zeros((0, 17, 2)), np.zeros((0, 17))
+        # one batch for all the people
+        batch_results = inference_topdown(self.model, rgb_frame, bboxes)
+        pred_instances = merge_data_samples(batch_results).pred_instances
+        return pred_instances.keypoints[:max_people], pred_instances.keypoint_scores[:max_people]
+
+    # detect the people of the BGR frame (when there is a detector) and estimate
+    # their pose on its RGB version, see estimate
+    def __call__(self, frame, rgb_frame, max_people=None):
+        bboxes = None if self.detector is None else self.detect_people(frame)
+        return self.estimate(rgb_frame, bboxes, max_people)
+
+
+# draws the COCO keypoints and skeleton of one person scored over 0.3 on rgb_frame
+def draw_pose(rgb_frame, keypoints, keypoint_scores):
+    #print("KEYPOINTS: " + str(keypoints))
+    #print("SCORE: " + str(keypoint_scores))
+    # Skeleton connections for COCO keypoints
+    skeleton = [
+        (0, 1),
+        (0, 2),
+        (1, 3),
+        (2, 4),  # Head to shoulders
+        (5, 6),
+        (5, 11),
+        (6, 12),
+        (11, 12),  # Torso
+        (5, 7),
+        (7, 9),
+        (6, 8),
+        (8, 10),  # Arms
+        (11, 13),
+        (13, 15),
+        (12, 14),
+        (14, 16),  # Legs
+    ]
+
+    for idx, (x, y) in enumerate(keypoints[:, :2]):
+        conf = keypoint_scores[idx]
+        if conf > 0.3:  # Confidence threshold
+            cv2.circle(rgb_frame, (int(x), int(y)), 3, (0, 255, 0), -1)
+
+    for start, end in skeleton:
+        if keypoint_scores[start] > 0.3 and keypoint_scores[end] > 0.3:
+            cv2.line(
+                rgb_frame,
+                (int(keypoints[start][0]), int(keypoints[start][1])),
+                (int(keypoints[end][0]), int(keypoints[end][1])),
+                (255, 0, 0),
+                2,
+            )
@@ -0,0 +1,99 @@
+# writes the default drum samples of drum_pads.json, synthesized so they can ship
+# with the repo (22.05 kHz, 16 bit mono wav). replace them with recorded ones for
+# a real kit. run from the project root:
+#   python samples/make_samples.py
+import os
+import wave
+
+import numpy as np
+
+rate = 22050
+rng = np.random.default_rng(0)
+
+
+def time_axis(seconds):
+    return np.arange(int(seconds * rate)) / rate
+
+def envelope(t, decay):
+    return np.exp(-t / decay)
+
+def noise(t):
+    return rng.uniform(-1, 1, len(t))
+
+# white noise with its low end taken out, for the cymbals
+def bright_noise(t):
+    x = noise(t)
+    return np.diff(x, prepend=0) / 2
+
+# a sine falling from start to end Hz, the body of kicks and toms
+def sweep(t, start, end, speed):
+    frequency = end + (start - end) * np.exp(-t * speed)
+    return np.sin(2 * np.pi * np.cumsum(frequency) / rate)
+
+# inharmonic partials of a metal plate
+def metal(t, base, ratios):
+    return sum(np.sin(2 * np.pi * base * ratio * t) for ratio in ratios) / len(ratios)
+
+def kick():
+    t = time_axis(0.5)
+    return sweep(t, 150, 45, 25) * envelope(t, 0.15)
+
+def snare():
+    t = time_axis(0.35)
+    return 0.6 * noise(t) * envelope(t, 0.07) + 0.5 * np.sin(2 * np.pi * 185 * t) * envelope(t, 0.05)
+
+def snare_rim():
+    t = time_axis(0.12)
+    return 0.8 * np.sin(2 * np.pi * 1700 * t) * envelope(t, 0.012) + 0.4 * noise(t) * envelope(t, 0.006)
+
+def hihat(decay, seconds):
+    t = time_axis(seconds)
+    return (bright_noise(t) + 0.3 * metal(t, 410, [7.1, 9.3, 11.7])) * envelope(t, decay)
+
+def ride():
+    t = time_axis(1.5)
+    return (0.3 * bright_noise(t) + 0.5 * metal(t, 370, [2.0, 3.2, 4.7, 6.1])) * envelope(t, 0.5)
+
+def ride_bell():
+    t = time_axis(1.5)
+    return metal(t, 620, [1.0, 2.1, 2.9, 4.2]) * envelope(t, 0.45)
+
+def crash():
+    t = time_axis(2.0)
+    return (bright_noise(t) + 0.2 * metal(t, 300, [3.1, 4.9, 6.3])) * envelope(t, 0.6)
+
+def tom(start, end):
+    t = time_axis(0.6)
+    return sweep(t, start, end, 8) * envelope(t, 0.2) + 0.1 * noise(t) * envelope(t, 0.02)
+
+samples = {
+    'kick.wav': kick,
+    'snare.wav': snare,
+    'snare_rim.wav': snare_rim,
+    'hithat_close.wav': lambda: hihat(0.03, 0.2),
+    'hit_hat.wav': lambda: hihat(0.05, 0.3),
+    'hit_hat_open.wav': lambda: hihat(0.25, 0.9),
+    'ride.wav': ride,
+    'ride_bell.wav': ride_bell,
+    'crash.wav': crash,
+    'tom_hi.wav': lambda: tom(330, 220),
+    'tom_mid.wav': lambda: tom(250, 160),
+    'tom_low.wav': lambda: tom(180, 110),
+}
+
+def write(path, signal):
+    signal = 0.9 * signal / np.abs(signal).max()
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes((signal * 32767).astype('<i2').tobytes())
+
+def main():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name, make in samples.items():
+        write(os.path.join(directory, name), make())
+        print(os.path.join(directory, name))
+
+if __name__ == "__main__":
+    main()
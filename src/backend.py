@@ -0,0 +1,38 @@
+import numpy as np
+import torch
+
+# inference backends for Body and Hand. every backend is called like the eager
+# model: a 1 x 3 x H x W (or N x ...) tensor in, the output tensor(s) out.
+# 'torchscript' and 'onnx' load the files written by src/export.py
+
+
+class TorchScriptBackend(object):
+    def __init__(self, model_path):
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = torch.jit.load(model_path, map_location=device)
+        self.model.eval()
+
+    def __call__(self, data):
+        return self.model(data)
+
+# onnxruntime on the CPU, outputs are returned as cpu tensors
+class OnnxBackend(object):
+    def __init__(self, model_path):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, data):
+        outputs = self.session.run(None, {self.input_name: np.ascontiguousarray(data.cpu().numpy())})
+        outputs = tuple(torch.from_numpy(output) for output in outputs)
+        return outputs if len(outputs) > 1 else outputs[0]
+
+backends = {
+    'torchscript': TorchScriptBackend,
+    'onnx': OnnxBackend,
+}
+
+def load(backend, model_path):
+    if backend not in backends:
+        raise ValueError("unknown backend '%s', expected 'eager' or one of %s" % (backend, sorted(backends)))
+    return backends[backend](model_path)
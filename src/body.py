@@ -9,42 +9,335 @@ import torch
 from torchvision import transforms
 
 from src import util
-from src.model import bodypose_model
+from src import torch_util
+from src import quantize
+from src.backend import load as load_backend
+from src.model import bodypose_model, output_stride
+
+# find connection in the specified sequence, center 29 is in the position 15
+limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
+           [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
+           [1, 16], [16, 18], [3, 17], [6, 18]]
+# the middle joints heatmap correpondence
+mapIdx = [[31, 32], [39, 40], [33, 34], [35, 36], [41, 42], [43, 44], [19, 20], [21, 22], \
+          [23, 24], [25, 26], [27, 28], [29, 30], [47, 48], [49, 50], [53, 54], [51, 52], \
+          [55, 56], [37, 38], [45, 46]]
+
+# find the local maxima of every part heatmap (H x W x parts) in one pass
+# returns one list of (x, y, score, id) per part, ids are numbered across all parts
+def find_peaks(heatmaps, thre1=0.1, sigma=3):
+    maps_ori = heatmaps.transpose(2, 0, 1)
+    # blur every channel at once, sigma 0 leaves the channel axis alone
+    maps = gaussian_filter(maps_ori, sigma=(0, sigma, sigma))
+
+    # non-maximum suppression against the 4 neighbours, compared through views
+    # instead of shifted copies; the border is always kept as it is compared
+    # against 0 and the threshold is positive
+    peaks_binary = maps > thre1
+    peaks_binary[:, 1:, :] &= maps[:, 1:, :] >= maps[:, :-1, :]
+    peaks_binary[:, :-1, :] &= maps[:, :-1, :] >= maps[:, 1:, :]
+    peaks_binary[:, :, 1:] &= maps[:, :, 1:] >= maps[:, :, :-1]
+    peaks_binary[:, :, :-1] &= maps[:, :, :-1] >= maps[:, :, 1:]
+
+    parts, ys, xs = np.nonzero(peaks_binary)  # sorted by part, then row major
+    scores = maps_ori[parts, ys, xs]
+    counts = np.bincount(parts, minlength=maps.shape[0]).tolist()
+    all_peaks = []
+    peak_counter = 0
+    for part in range(maps.shape[0]):
+        peak_slice = slice(peak_counter, peak_counter + counts[part])
+        all_peaks.append(list(zip(xs[peak_slice], ys[peak_slice], scores[peak_slice],
+                                  range(peak_slice.start, peak_slice.stop))))  # note reverse
+        peak_counter += counts[part]
+    return all_peaks
+
+# move every peak of all_peaks to its sub-pixel position on heatmaps (H x W x parts)
+def refine_peaks(heatmaps, all_peaks):
+    refined = []
+    for part, peaks in enumerate(all_peaks):
+        if len(peaks) == 0:
+            refined.append([])
+            continue
+        xs, ys = util.refine_peak(heatmaps[:, :, part], [p[0] for p in peaks], [p[1] for p in peaks])
+        refined.append([(x, y) + p[2:] for x, y, p in zip(xs, ys, peaks)])
+    return refined
+
+# reference implementation, scores the (i, j) pairs one at a time,
+# used by Body(..., vectorized=False)
+def score_limb_loop(candA, candB, score_mid, image_height, mid_num=10, thre2=0.05):
+    connection_candidate = []
+    for i in range(len(candA)):
+        for j in range(len(candB)):
+            vec = np.subtract(candB[j][:2], candA[i][:2])
+            norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
+            norm = max(0.001, norm)
+            vec = np.divide(vec, norm)
+
+            startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
+                                np.linspace(candA[i][1], candB[j][1], num=mid_num)))
+
+            vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
+                              for I in range(len(startend))])
+            vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
+                              for I in range(len(startend))])
+
+            score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
+            score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
+                0.5 * image_height / norm - 1, 0)
+            criterion1 = len(np.nonzero(score_midpts > thre2)[0]) > 0.8 * len(score_midpts)
+            criterion2 = score_with_dist_prior > 0
+            if criterion1 and criterion2:
+                connection_candidate.append(
+                    [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
+    return connection_candidate
+
+# scores all the (i, j) pairs of a limb at once, same output as score_limb_loop
+def score_limb(candA, candB, score_mid, image_height, mid_num=10, thre2=0.05):
+    if len(candA) == 0 or len(candB) == 0:
+        return []
+    candA = np.asarray(candA, dtype=np.float64)
+    candB = np.asarray(candB, dtype=np.float64)
+    # nA x nB x 2
+    vec = candB[np.newaxis, :, :2] - candA[:, np.newaxis, :2]
+    norm = np.maximum(0.001, np.sqrt(vec[..., 0] * vec[..., 0] + vec[..., 1] * vec[..., 1]))
+    vec = vec / norm[..., np.newaxis]
+
+    # nA x nB x mid_num sample positions along every candidate limb
+    xs = np.linspace(candA[:, np.newaxis, 0], candB[np.newaxis, :, 0], num=mid_num, axis=-1)
+    ys = np.linspace(candA[:, np.newaxis, 1], candB[np.newaxis, :, 1], num=mid_num, axis=-1)
+    xs = np.rint(xs).astype(np.intp)
+    ys = np.rint(ys).astype(np.intp)
+    samples = score_mid[ys, xs]
+    vec_x = samples[..., 0]
+    vec_y = samples[..., 1]
+
+    score_midpts = vec_x * vec[..., 0:1] + vec_y * vec[..., 1:2]
+    score_with_dist_prior = score_midpts.mean(axis=-1) + np.minimum(0.5 * image_height / norm - 1, 0)
+    criterion1 = np.count_nonzero(score_midpts > thre2, axis=-1) > 0.8 * mid_num
+    criterion2 = score_with_dist_prior > 0
+
+    # row-major order of the valid pairs matches the i, j loop order
+    ii, jj = np.nonzero(criterion1 & criterion2)
+    scores = score_with_dist_prior[ii, jj]
+    totals = scores + candA[ii, 2] + candB[jj, 2]
+    return [[i, j, s, t] for i, j, s, t in zip(ii.tolist(), jj.tolist(), scores.tolist(), totals.tolist())]
+
+# group the limb connections into people, each person is one row of subset
+def assemble_people(candidate, connection_all, special_k):
+    # every connection creates at most one person, so the rows are preallocated
+    # and never move; merged people are only marked dead
+    # last number in each row is the total parts number of that person
+    # the second last number in each row is the score of the overall configuration
+    max_people = sum(len(connection_all[k]) for k in range(len(mapIdx)) if k not in special_k)
+    subset = -1 * np.ones((max_people, 20))
+    alive = np.zeros(max_people, dtype=bool)
+    num_people = 0
+    # peak id -> rows of subset holding that peak
+    owner = [[] for _ in range(len(candidate))]
+
+    def set_part(j, index, part):
+        old = int(subset[j][index])
+        if old >= 0:
+            owner[old].remove(j)
+        subset[j][index] = part
+        owner[int(part)].append(j)
+
+    for k in range(len(mapIdx)):
+        if k in special_k:
+            continue
+        partAs = connection_all[k][:, 0]
+        partBs = connection_all[k][:, 1]
+        indexA, indexB = np.array(limbSeq[k]) - 1
+
+        for i in range(len(connection_all[k])):
+            # a peak belongs to a single part type, so owner[] only matches its own column
+            subset_idx = sorted(set(owner[int(partAs[i])]) | set(owner[int(partBs[i])]))[:2]
+            found = len(subset_idx)
+
+            if found == 1:
+                j = subset_idx[0]
+                if subset[j][indexB] != partBs[i]:
+                    set_part(j, indexB, partBs[i])
+                    subset[j][-1] += 1
+                    subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+            elif found == 2:  # if found 2 and disjoint, merge them
+                j1, j2 = subset_idx
+                if not np.any((subset[j1][:-2] >= 0) & (subset[j2][:-2] >= 0)):  # merge
+                    subset[j1][:-2] += (subset[j2][:-2] + 1)
+                    subset[j1][-2:] += subset[j2][-2:]
+                    subset[j1][-2] += connection_all[k][i][2]
+                    alive[j2] = False
+                    for part in subset[j2][:-2][subset[j2][:-2] >= 0].astype(int):
+                        owner[part][owner[part].index(j2)] = j1
+                else:  # as like found == 1
+                    set_part(j1, indexB, partBs[i])
+                    subset[j1][-1] += 1
+                    subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+
+            # if find no partA in the subset, create a new subset
+            elif not found and k < 17:
+                j = num_people
+                num_people += 1
+                alive[j] = True
+                set_part(j, indexA, partAs[i])
+                set_part(j, indexB, partBs[i])
+                subset[j][-1] = 2
+                subset[j][-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
+
+    subset = subset[:num_people][alive[:num_people]]
+    # delete some rows of subset which has few parts occur
+    keep = (subset[:, -1] >= 4) & (subset[:, -2] / subset[:, -1] >= 0.4)
+    return subset[keep]
+
+# accuracy / speed trade-offs, Body(model_path, preset) and any of the values
+# can be overridden by keyword, e.g. Body(model_path, 'balanced', thre1=0.2)
+# stages trades accuracy for speed by stopping the network early (6 runs all of it),
+# the higher thre1 of 'realtime' keeps fewer, stronger peaks to pair into limbs.
+# 'balanced' is the original single scale, full network setting
+presets = {
+    'realtime': {'scale_search': [0.5], 'boxsize': 368, 'thre1': 0.15, 'thre2': 0.05, 'mid_num': 10, 'stages': 3},
+    'balanced': {'scale_search': [0.5], 'boxsize': 368, 'thre1': 0.1, 'thre2': 0.05, 'mid_num': 10, 'stages': 6},
+    'accurate': {'scale_search': [0.5, 1.0, 1.5, 2.0], 'boxsize': 368, 'thre1': 0.1, 'thre2': 0.05, 'mid_num': 10, 'stages': 6},
+}
 
 class Body(object):
-    def __init__(self, model_path):
-        self.model = bodypose_model()
-        if torch.cuda.is_available():
-            self.model = self.model.cuda()
-        model_dict = util.transfer(self.model, torch.load(model_path))
-        self.model.load_state_dict(model_dict)
+    stride = output_stride(bodypose_model)
+    padValue = 128
+
+    # device_postprocess keeps resizing, averaging and peak finding on the torch
+    # device of the model (default when cuda is available), the numpy path is the fallback
+    # backend is 'eager', or 'torchscript' / 'onnx' with model_path an exported network
+    # stages (1 - 6) stops the eager network after that stage, an exported network
+    # keeps the stage count it was exported with (src/export.py --stages), passing
+    # stages with it raises ValueError
+    # quantized runs a conv + relu fused, static int8 version of the network on the cpu,
+    # calibrated on calibration_images (paths, default the bundled images)
+    # weights_cache is the directory caching the converted weights (default cache/ next
+    # to model_path)
+    # native_resolution finds the peaks on the stride 8 network output with sub-pixel
+    # refinement instead of on maps upsampled to the image size
+    def __init__(self, model_path, preset='balanced', vectorized=True, device_postprocess=None,
+                 native_resolution=False, backend='eager', quantized=False,
+                 calibration_images=None, weights_cache=None, **params):
+        settings = dict(presets[preset])
+        for name, value in params.items():
+            if name not in settings:
+                raise TypeError("unexpected parameter '%s'" % name)
+            settings[name] = value
+        self.scale_search = settings['scale_search']
+        self.boxsize = settings['boxsize']
+        self.stages = settings['stages']
+        self.thre1 = settings['thre1']
+        self.thre2 = settings['thre2']
+        self.mid_num = settings['mid_num']
+
+        self.score_limb = score_limb if vectorized else score_limb_loop
+        if device_postprocess is None:
+            device_postprocess = torch.cuda.is_available()
+        self.device_postprocess = device_postprocess
+        self.native_resolution = native_resolution
+        # the int8 model only runs on the cpu
+        self.device = torch.device('cuda' if torch.cuda.is_available() and not quantized else 'cpu')
+        self.inputs = util.InputBuffer(bodypose_model, self.padValue, self.device)
+        self.heatmap_avg = util.MapAccumulator(19)
+        self.paf_avg = util.MapAccumulator(38)
+        self.device_heatmap_avg = torch_util.MapAccumulator(19)
+        self.device_paf_avg = torch_util.MapAccumulator(38)
+        if backend != 'eager':
+            if quantized:
+                raise ValueError("quantized only applies to the eager backend, not '%s'" % backend)
+            if 'stages' in params:
+                raise ValueError("stages only applies to the eager backend, export the network "
+                                 "with src/export.py --stages for '%s'" % backend)
+            # model_path is a .pt / .onnx file written by src/export.py
+            self.model = load_backend(backend, model_path)
+            return
+        # built on the meta device to skip the random initialization, load_weights
+        # assigns every parameter
+        with torch.device('meta'):
+            self.model = bodypose_model(self.stages)
+        util.load_weights(self.model, model_path, weights_cache)
         self.model.eval()
+        if quantized:
+            self.model = quantize.prepare(self.model)
+            for path in calibration_images or quantize.body_calibration_images:
+                oriImg = cv2.imread(path)  # B,G,R order
+                for x in self.scale_search:
+                    self.inference(oriImg, x * self.boxsize / oriImg.shape[0])
+            self.model = quantize.convert(self.model)
+        else:
+            self.model = self.model.to(self.device)
 
     def __call__(self, oriImg):
-        # scale_search = [0.5, 1.0, 1.5, 2.0]
-        scale_search = [0.5]
-        boxsize = 368
-        stride = 8
-        padValue = 128
-        thre1 = 0.1
-        thre2 = 0.05
-        multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
-        heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 19))
-        paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
-
-        for m in range(len(multiplier)):
-            scale = multiplier[m]
-            imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-            imageToTest_padded, pad = util.padRightDownCorner(imageToTest, stride, padValue)
-            im = np.transpose(np.float32(imageToTest_padded[:, :, :, np.newaxis]), (3, 2, 0, 1)) / 256 - 0.5
-            im = np.ascontiguousarray(im)
-
-            data = torch.from_numpy(im).float()
-            if torch.cuda.is_available():
-                data = data.cuda()
-            # data = data.permute([2, 0, 1]).unsqueeze(0).float()
+        multiplier = [x * self.boxsize / oriImg.shape[0] for x in self.scale_search]
+        outputs = [self.inference(oriImg, scale) for scale in multiplier]
+        return self.postprocess(oriImg.shape, outputs)
+
+    # run several frames through the network together, returns a (candidate, subset)
+    # per frame. for every scale the resized frames are padded to a common stride
+    # aligned size and stacked, so the network runs once per scale and batch_size frames.
+    # a chunk is parsed as soon as all its scales ran, only one chunk of outputs is kept
+    def batch(self, frames, batch_size=8):
+        results = []
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            outputs = [[] for _ in chunk]
+            for x in self.scale_search:
+                scales = [x * self.boxsize / frame.shape[0] for frame in chunk]
+                images = [cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+                          for frame, scale in zip(chunk, scales)]
+                data, padded_shape, pads = self.inputs.fill(images)
+                with torch.no_grad():
+                    Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data)
+                for n in range(len(chunk)):
+                    outputs[n].append((Mconv7_stage6_L1[n:n + 1], Mconv7_stage6_L2[n:n + 1],
+                                       padded_shape, pads[n], scales[n]))
+            results.extend(self.postprocess(frame.shape, frame_outputs)
+                           for frame, frame_outputs in zip(chunk, outputs))
+        return results
+
+    # run the network on oriImg resized by scale, the outputs stay on the model device
+    def inference(self, oriImg, scale):
+        imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        data, padded_shape, (pad,) = self.inputs.fill([imageToTest])
+        with torch.no_grad():
+            Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data)
+        return Mconv7_stage6_L1, Mconv7_stage6_L2, padded_shape, pad, scale
+
+    # average the outputs of every scale and parse them into people
+    def postprocess(self, ori_shape, outputs):
+        stride = self.stride
+        thre1 = self.thre1
+        thre2 = self.thre2
+
+        if self.native_resolution:
+            (paf_avg, heatmap_avg), scale = util.native_average(outputs, stride)
+            # sigma 3 of the image size, in network cells
+            all_peaks = find_peaks(heatmap_avg[:, :, :18], thre1, sigma=3 * scale / stride)
+            all_peaks = refine_peaks(heatmap_avg, all_peaks)
+            candidate, subset = self.connect(all_peaks, paf_avg, heatmap_avg.shape[0], thre2)
+            if len(candidate):
+                candidate[:, :2] = (candidate[:, :2] + 0.5) * stride / scale - 0.5
+            return candidate, subset
+
+        if self.device_postprocess:
+            device = outputs[0][0].device
+            self.device_heatmap_avg.reset(ori_shape[0], ori_shape[1], device)
+            self.device_paf_avg.reset(ori_shape[0], ori_shape[1], device)
             with torch.no_grad():
-                Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data)
+                for Mconv7_stage6_L1, Mconv7_stage6_L2, padded_shape, pad, scale in outputs:
+                    self.device_heatmap_avg.add(torch_util.resize_output(
+                        Mconv7_stage6_L2, stride, padded_shape, pad, ori_shape))
+                    self.device_paf_avg.add(torch_util.resize_output(
+                        Mconv7_stage6_L1, stride, padded_shape, pad, ori_shape))
+                heatmap_avg = self.device_heatmap_avg.average()
+                paf_avg = self.device_paf_avg.average()
+                all_peaks = torch_util.find_peaks(heatmap_avg[:18], thre1)
+            return self.connect(all_peaks, paf_avg, ori_shape[0], thre2)
+
+        self.heatmap_avg.reset(ori_shape[0], ori_shape[1])
+        self.paf_avg.reset(ori_shape[0], ori_shape[1])
+        for Mconv7_stage6_L1, Mconv7_stage6_L2, padded_shape, pad, scale in outputs:
             Mconv7_stage6_L1 = Mconv7_stage6_L1.cpu().numpy()
             Mconv7_stage6_L2 = Mconv7_stage6_L2.cpu().numpy()
 
@@ -52,156 +345,69 @@ class Body(object):
             # heatmap = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[1]].data), (1, 2, 0))  # output 1 is heatmaps
             heatmap = np.transpose(np.squeeze(Mconv7_stage6_L2), (1, 2, 0))  # output 1 is heatmaps
             heatmap = cv2.resize(heatmap, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            heatmap = heatmap[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
-            heatmap = cv2.resize(heatmap, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
+            heatmap = heatmap[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
+            heatmap = cv2.resize(heatmap, (ori_shape[1], ori_shape[0]), interpolation=cv2.INTER_CUBIC)
 
             # paf = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[0]].data), (1, 2, 0))  # output 0 is PAFs
             paf = np.transpose(np.squeeze(Mconv7_stage6_L1), (1, 2, 0))  # output 0 is PAFs
             paf = cv2.resize(paf, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            paf = paf[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
-            paf = cv2.resize(paf, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
-
-            heatmap_avg += heatmap_avg + heatmap / len(multiplier)
-            paf_avg += + paf / len(multiplier)
-
-        all_peaks = []
-        peak_counter = 0
-
-        for part in range(18):
-            map_ori = heatmap_avg[:, :, part]
-            one_heatmap = gaussian_filter(map_ori, sigma=3)
-
-            map_left = np.zeros(one_heatmap.shape)
-            map_left[1:, :] = one_heatmap[:-1, :]
-            map_right = np.zeros(one_heatmap.shape)
-            map_right[:-1, :] = one_heatmap[1:, :]
-            map_up = np.zeros(one_heatmap.shape)
-            map_up[:, 1:] = one_heatmap[:, :-1]
-            map_down = np.zeros(one_heatmap.shape)
-            map_down[:, :-1] = one_heatmap[:, 1:]
-
-            peaks_binary = np.logical_and.reduce(
-                (one_heatmap >= map_left, one_heatmap >= map_right, one_heatmap >= map_up, one_heatmap >= map_down, one_heatmap > thre1))
-            peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0]))  # note reverse
-            peaks_with_score = [x + (map_ori[x[1], x[0]],) for x in peaks]
-            peak_id = range(peak_counter, peak_counter + len(peaks))
-            peaks_with_score_and_id = [peaks_with_score[i] + (peak_id[i],) for i in range(len(peak_id))]
-
-            all_peaks.append(peaks_with_score_and_id)
-            peak_counter += len(peaks)
-
-        # find connection in the specified sequence, center 29 is in the position 15
-        limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
-                   [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
-                   [1, 16], [16, 18], [3, 17], [6, 18]]
-        # the middle joints heatmap correpondence
-        mapIdx = [[31, 32], [39, 40], [33, 34], [35, 36], [41, 42], [43, 44], [19, 20], [21, 22], \
-                  [23, 24], [25, 26], [27, 28], [29, 30], [47, 48], [49, 50], [53, 54], [51, 52], \
-                  [55, 56], [37, 38], [45, 46]]
+            paf = paf[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
+            paf = cv2.resize(paf, (ori_shape[1], ori_shape[0]), interpolation=cv2.INTER_CUBIC)
+
+            self.heatmap_avg.add(heatmap)
+            self.paf_avg.add(paf)
 
+        heatmap_avg = self.heatmap_avg.average()
+        paf_avg = self.paf_avg.average()
+        all_peaks = find_peaks(heatmap_avg[:, :, :18], thre1)
+        return self.connect(all_peaks, paf_avg, ori_shape[0], thre2)
+
+    # score the limbs between the peaks and group them into people, paf_avg is
+    # either H x W x 38 numpy or a 38 x H x W tensor on the device
+    def connect(self, all_peaks, paf_avg, image_height, thre2):
         connection_all = []
         special_k = []
-        mid_num = 10
+        mid_num = self.mid_num
 
         for k in range(len(mapIdx)):
-            score_mid = paf_avg[:, :, [x - 19 for x in mapIdx[k]]]
+            channels = [x - 19 for x in mapIdx[k]]
+            if torch.is_tensor(paf_avg):
+                score_mid = torch_util.DeviceMaps(paf_avg, channels)
+            else:
+                score_mid = paf_avg[:, :, channels]
             candA = all_peaks[limbSeq[k][0] - 1]
             candB = all_peaks[limbSeq[k][1] - 1]
             nA = len(candA)
             nB = len(candB)
             indexA, indexB = limbSeq[k]
             if (nA != 0 and nB != 0):
-                connection_candidate = []
-                for i in range(nA):
-                    for j in range(nB):
-                        vec = np.subtract(candB[j][:2], candA[i][:2])
-                        norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
-                        norm = max(0.001, norm)
-                        vec = np.divide(vec, norm)
-
-                        startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
-                                            np.linspace(candA[i][1], candB[j][1], num=mid_num)))
-
-                        vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
-                                          for I in range(len(startend))])
-                        vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
-                                          for I in range(len(startend))])
-
-                        score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
-                        score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
-                            0.5 * oriImg.shape[0] / norm - 1, 0)
-                        criterion1 = len(np.nonzero(score_midpts > thre2)[0]) > 0.8 * len(score_midpts)
-                        criterion2 = score_with_dist_prior > 0
-                        if criterion1 and criterion2:
-                            connection_candidate.append(
-                                [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
+                # DeviceMaps only supports the batched gathers of score_limb
+                scorer = score_limb if torch.is_tensor(paf_avg) else self.score_limb
+                connection_candidate = scorer(candA, candB, score_mid, image_height, mid_num, thre2)
 
                 connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
-                connection = np.zeros((0, 5))
+                max_connections = min(nA, nB)
+                connection = np.zeros((max_connections, 5))
+                usedA = np.zeros(nA, dtype=bool)
+                usedB = np.zeros(nB, dtype=bool)
+                num_connections = 0
                 for c in range(len(connection_candidate)):
                     i, j, s = connection_candidate[c][0:3]
-                    if (i not in connection[:, 3] and j not in connection[:, 4]):
-                        connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
-                        if (len(connection) >= min(nA, nB)):
+                    if (not usedA[i] and not usedB[j]):
+                        connection[num_connections] = [candA[i][3], candB[j][3], s, i, j]
+                        usedA[i] = usedB[j] = True
+                        num_connections += 1
+                        if (num_connections >= max_connections):
                             break
+                connection = connection[:num_connections]
 
                 connection_all.append(connection)
             else:
                 special_k.append(k)
                 connection_all.append([])
 
-        # last number in each row is the total parts number of that person
-        # the second last number in each row is the score of the overall configuration
-        subset = -1 * np.ones((0, 20))
         candidate = np.array([item for sublist in all_peaks for item in sublist])
-
-        for k in range(len(mapIdx)):
-            if k not in special_k:
-                partAs = connection_all[k][:, 0]
-                partBs = connection_all[k][:, 1]
-                indexA, indexB = np.array(limbSeq[k]) - 1
-
-                for i in range(len(connection_all[k])):  # = 1:size(temp,1)
-                    found = 0
-                    subset_idx = [-1, -1]
-                    for j in range(len(subset)):  # 1:size(subset,1):
-                        if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
-                            subset_idx[found] = j
-                            found += 1
-
-                    if found == 1:
-                        j = subset_idx[0]
-                        if subset[j][indexB] != partBs[i]:
-                            subset[j][indexB] = partBs[i]
-                            subset[j][-1] += 1
-                            subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-                    elif found == 2:  # if found 2 and disjoint, merge them
-                        j1, j2 = subset_idx
-                        membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
-                        if len(np.nonzero(membership == 2)[0]) == 0:  # merge
-                            subset[j1][:-2] += (subset[j2][:-2] + 1)
-                            subset[j1][-2:] += subset[j2][-2:]
-                            subset[j1][-2] += connection_all[k][i][2]
-                            subset = np.delete(subset, j2, 0)
-                        else:  # as like found == 1
-                            subset[j1][indexB] = partBs[i]
-                            subset[j1][-1] += 1
-                            subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-
-                    # if find no partA in the subset, create a new subset
-                    elif not found and k < 17:
-                        row = -1 * np.ones(20)
-                        row[indexA] = partAs[i]
-                        row[indexB] = partBs[i]
-                        row[-1] = 2
-                        row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
-                        subset = np.vstack([subset, row])
-        # delete some rows of subset which has few parts occur
-        deleteIdx = []
-        for i in range(len(subset)):
-            if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
-                deleteIdx.append(i)
-        subset = np.delete(subset, deleteIdx, axis=0)
+        subset = assemble_people(candidate, connection_all, special_k)
 
         # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
         # candidate: x, y, score, id
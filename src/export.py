@@ -0,0 +1,69 @@
+import argparse
+import os
+
+import torch
+
+from src import util
+from src.model import bodypose_model, handpose_model
+
+# export the caffe converted networks to TorchScript (.pt) and ONNX (.onnx) with
+# dynamic batch and spatial dims, for Body / Hand backend='torchscript' or 'onnx'.
+# run from the project root:
+#   python -m src.export --body-model model/body_pose_model.pth --hand-model model/hand_pose_model.pth
+
+# names of the last layers of the stage the network stops after
+def output_names(network, stages=6):
+    if network == 'body':
+        if stages == 1:
+            return ['conv5_5_CPM_L1', 'conv5_5_CPM_L2']
+        return ['Mconv7_stage%d_L1' % stages, 'Mconv7_stage%d_L2' % stages]
+    return ['conv6_2_CPM'] if stages == 1 else ['Mconv7_stage%d' % stages]
+
+
+def load_eager(network, model_path, stages=6):
+    with torch.device('meta'):
+        model = bodypose_model(stages) if network == 'body' else handpose_model(stages)
+    util.load_weights(model, model_path)
+    model.eval()
+    return model
+
+def export_torchscript(model, path):
+    torch.jit.save(torch.jit.script(model), path)
+
+def export_onnx(model, path, network):
+    names = output_names(network, model.stages)
+    dynamic_axes = {'image': {0: 'batch', 2: 'height', 3: 'width'}}
+    for name in names:
+        dynamic_axes[name] = {0: 'batch', 2: 'out_height', 3: 'out_width'}
+    torch.onnx.export(model, (torch.zeros((1, 3, 368, 368)),), path, input_names=['image'],
+                      output_names=names, dynamic_axes=dynamic_axes, opset_version=17)
+
+# writes <name>.pt and <name>.onnx next to model_path or in out_dir, networks
+# stopping early get a _stages<N> suffix
+def export(network, model_path, out_dir=None, stages=6):
+    model = load_eager(network, model_path, stages)
+    base = os.path.splitext(os.path.basename(model_path))[0]
+    if stages != 6:
+        base += '_stages%d' % stages
+    out_dir = out_dir or os.path.dirname(model_path)
+    paths = os.path.join(out_dir, base + '.pt'), os.path.join(out_dir, base + '.onnx')
+    with torch.no_grad():
+        export_torchscript(model, paths[0])
+        export_onnx(model, paths[1], network)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-model', help='caffe converted body .pth')
+    parser.add_argument('--hand-model', help='caffe converted hand .pth')
+    parser.add_argument('--out-dir', help='defaults to the directory of each model')
+    parser.add_argument('--stages', type=int, default=6, choices=range(1, 7),
+                        help='stop the networks after this stage')
+    args = parser.parse_args()
+    for network, model_path in [('body', args.body_model), ('hand', args.hand_model)]:
+        if model_path:
+            for path in export(network, model_path, args.out_dir, args.stages):
+                print('exported %s' % path)
+
+if __name__ == "__main__":
+    main()
@@ -9,69 +9,185 @@ import matplotlib
 import torch
 from skimage.measure import label
 
-from src.model import handpose_model
+from src.model import handpose_model, output_stride
 from src import util
+from src import torch_util
+from src import quantize
+from src.backend import load as load_backend
+
+# for every part the maximum of the blob with the largest sum of heatmaps
+# (H x W x parts), [0, 0] when nothing is above thre. heatmaps is overwritten.
+# returns the parts x 2 peaks and the mask of the parts that were found
+def find_hand_peaks(heatmaps, thre=0.05, sigma=3):
+    all_peaks = []
+    found = np.zeros(heatmaps.shape[2], dtype=bool)
+    for part in range(heatmaps.shape[2]):
+        map_ori = heatmaps[:, :, part]
+        one_heatmap = gaussian_filter(map_ori, sigma=sigma)
+        binary = np.ascontiguousarray(one_heatmap > thre, dtype=np.uint8)
+        # 全部小于阈值
+        if np.sum(binary) == 0:
+            all_peaks.append([0, 0])
+            continue
+        label_img, label_numbers = label(binary, return_num=True, connectivity=binary.ndim)
+        max_index = np.argmax([np.sum(map_ori[label_img == i]) for i in range(1, label_numbers + 1)]) + 1
+        label_img[label_img != max_index] = 0
+        map_ori[label_img == 0] = 0
+
+        y, x = util.npmax(map_ori)
+        all_peaks.append([x, y])
+        found[part] = True
+    return np.array(all_peaks), found
+
+# accuracy / speed trade-offs, Hand(model_path, preset) and any of the values
+# can be overridden by keyword, e.g. Hand(model_path, 'balanced', thre=0.1)
+# stages trades accuracy for speed by stopping the network early (6 runs all of it),
+# the higher thre of 'realtime' drops the weak keypoints and shrinks the blobs to label
+presets = {
+    'realtime': {'scale_search': [1.0], 'boxsize': 368, 'thre': 0.1, 'stages': 3},
+    'balanced': {'scale_search': [0.5, 1.0], 'boxsize': 368, 'thre': 0.05, 'stages': 6},
+    'accurate': {'scale_search': [0.5, 1.0, 1.5, 2.0], 'boxsize': 368, 'thre': 0.05, 'stages': 6},
+}
 
 class Hand(object):
-    def __init__(self, model_path):
-        self.model = handpose_model()
-        if torch.cuda.is_available():
-            self.model = self.model.cuda()
-        model_dict = util.transfer(self.model, torch.load(model_path))
-        self.model.load_state_dict(model_dict)
+    stride = output_stride(handpose_model)
+    padValue = 128
+
+    # device_postprocess keeps resizing, averaging and peak finding on the torch
+    # device of the model (default when cuda is available), the numpy path is the fallback
+    # backend is 'eager', or 'torchscript' / 'onnx' with model_path an exported network
+    # stages (1 - 6) stops the eager network after that stage, an exported network
+    # keeps the stage count it was exported with (src/export.py --stages), passing
+    # stages with it raises ValueError
+    # quantized runs a conv + relu fused, static int8 version of the network on the cpu,
+    # calibrated on calibration_images (paths, default the bundled images)
+    # weights_cache is the directory caching the converted weights (default cache/ next
+    # to model_path)
+    # native_resolution finds the peaks on the stride 8 network output with sub-pixel
+    # refinement instead of on maps upsampled to the image size, peaks are then floats
+    def __init__(self, model_path, preset='accurate', device_postprocess=None, native_resolution=False,
+                 backend='eager', quantized=False, calibration_images=None, weights_cache=None, **params):
+        settings = dict(presets[preset])
+        for name, value in params.items():
+            if name not in settings:
+                raise TypeError("unexpected parameter '%s'" % name)
+            settings[name] = value
+        self.scale_search = settings['scale_search']
+        self.boxsize = settings['boxsize']
+        self.stages = settings['stages']
+        self.thre = settings['thre']
+
+        if device_postprocess is None:
+            device_postprocess = torch.cuda.is_available()
+        self.device_postprocess = device_postprocess
+        self.native_resolution = native_resolution
+        # the int8 model only runs on the cpu
+        self.device = torch.device('cuda' if torch.cuda.is_available() and not quantized else 'cpu')
+        self.inputs = util.InputBuffer(handpose_model, self.padValue, self.device)
+        self.heatmap_avg = util.MapAccumulator(22)
+        self.device_heatmap_avg = torch_util.MapAccumulator(22)
+        if backend != 'eager':
+            if quantized:
+                raise ValueError("quantized only applies to the eager backend, not '%s'" % backend)
+            if 'stages' in params:
+                raise ValueError("stages only applies to the eager backend, export the network "
+                                 "with src/export.py --stages for '%s'" % backend)
+            # model_path is a .pt / .onnx file written by src/export.py
+            self.model = load_backend(backend, model_path)
+            return
+        # built on the meta device to skip the random initialization, load_weights
+        # assigns every parameter
+        with torch.device('meta'):
+            self.model = handpose_model(self.stages)
+        util.load_weights(self.model, model_path, weights_cache)
         self.model.eval()
+        if quantized:
+            self.model = quantize.prepare(self.model)
+            for path in calibration_images or quantize.hand_calibration_images:
+                oriImg = cv2.imread(path)  # B,G,R order
+                for x in self.scale_search:
+                    self.inference(oriImg, x * self.boxsize / oriImg.shape[0])
+            self.model = quantize.convert(self.model)
+        else:
+            self.model = self.model.to(self.device)
 
     def __call__(self, oriImg):
-        scale_search = [0.5, 1.0, 1.5, 2.0]
-        # scale_search = [0.5]
-        boxsize = 368
-        stride = 8
-        padValue = 128
-        thre = 0.05
-        multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
-        heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 22))
-        # paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
-
-        for m in range(len(multiplier)):
-            scale = multiplier[m]
-            imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-            imageToTest_padded, pad = util.padRightDownCorner(imageToTest, stride, padValue)
-            im = np.transpose(np.float32(imageToTest_padded[:, :, :, np.newaxis]), (3, 2, 0, 1)) / 256 - 0.5
-            im = np.ascontiguousarray(im)
-
-            data = torch.from_numpy(im).float()
-            if torch.cuda.is_available():
-                data = data.cuda()
-            # data = data.permute([2, 0, 1]).unsqueeze(0).float()
+        multiplier = [x * self.boxsize / oriImg.shape[0] for x in self.scale_search]
+        outputs = [self.inference(oriImg, scale) for scale in multiplier]
+        peaks, found = self.postprocess(oriImg.shape, outputs)
+        return peaks
+
+    # keypoints of every hand box [x, y, w, is_left] of util.handDetect in oriImg.
+    # the crops are resized to the same size for each scale and all the hands go
+    # through the network together, one batch per scale. returns a 21 x 2 array of
+    # frame coordinates per box, [0, 0] for the keypoints that were not found
+    def detect(self, oriImg, hands):
+        if len(hands) == 0:
+            return []
+        crops = [oriImg[y:y + w, x:x + w, :] for x, y, w, is_left in hands]
+        outputs = [[] for _ in hands]
+        for x in self.scale_search:
+            size = int(round(x * self.boxsize))
+            images = [cv2.resize(crop, (size, size), interpolation=cv2.INTER_CUBIC) for crop in crops]
+            data, padded_shape, pads = self.inputs.fill(images)
             with torch.no_grad():
-                output = self.model(data).cpu().numpy()
-                # output = self.model(data).numpy()q
+                output = self.model(data)
+            for n, crop in enumerate(crops):
+                outputs[n].append((output[n:n + 1], padded_shape, pads[n], size / crop.shape[0]))
+
+        all_peaks = []
+        for (x, y, w, is_left), crop, hand_outputs in zip(hands, crops, outputs):
+            peaks, found = self.postprocess(crop.shape, hand_outputs)
+            peaks[found] += [x, y]
+            all_peaks.append(peaks)
+        return all_peaks
+
+    # run the network on oriImg resized by scale, the output stays on the model device
+    def inference(self, oriImg, scale):
+        imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        data, padded_shape, (pad,) = self.inputs.fill([imageToTest])
+        with torch.no_grad():
+            output = self.model(data)
+        return output, padded_shape, pad, scale
+
+    # average the outputs of every scale and find the 21 keypoints, returns the
+    # 21 x 2 peaks ([0, 0] when not found) and the mask of the keypoints found
+    def postprocess(self, ori_shape, outputs):
+        stride = self.stride
+        thre = self.thre
+
+        if self.native_resolution:
+            (heatmap_avg,), scale = util.native_average(outputs, stride)
+            # sigma 3 of the image size, in network cells
+            all_peaks, found = find_hand_peaks(heatmap_avg[:, :, :21].copy(), thre, sigma=3 * scale / stride)
+            peaks = np.zeros(all_peaks.shape)
+            for part in np.nonzero(found)[0]:
+                x, y = util.refine_peak(heatmap_avg[:, :, part], all_peaks[part:part + 1, 0], all_peaks[part:part + 1, 1])
+                peaks[part] = [x[0], y[0]]
+            peaks[found] = (peaks[found] + 0.5) * stride / scale - 0.5
+            return peaks, found
+
+        if self.device_postprocess:
+            self.device_heatmap_avg.reset(ori_shape[0], ori_shape[1], outputs[0][0].device)
+            with torch.no_grad():
+                for output, padded_shape, pad, scale in outputs:
+                    self.device_heatmap_avg.add(torch_util.resize_output(output, stride, padded_shape, pad, ori_shape))
+                return torch_util.find_hand_peaks(self.device_heatmap_avg.average()[:21], thre)
+
+        self.heatmap_avg.reset(ori_shape[0], ori_shape[1])
+        for output, padded_shape, pad, scale in outputs:
+            output = output.cpu().numpy()
+            # output = self.model(data).numpy()q
 
             # extract outputs, resize, and remove padding
             heatmap = np.transpose(np.squeeze(output), (1, 2, 0))  # output 1 is heatmaps
             heatmap = cv2.resize(heatmap, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            heatmap = heatmap[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
-            heatmap = cv2.resize(heatmap, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
+            heatmap = heatmap[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
+            heatmap = cv2.resize(heatmap, (ori_shape[1], ori_shape[0]), interpolation=cv2.INTER_CUBIC)
 
-            heatmap_avg += heatmap / len(multiplier)
+            self.heatmap_avg.add(heatmap)
 
-        all_peaks = []
-        for part in range(21):
-            map_ori = heatmap_avg[:, :, part]
-            one_heatmap = gaussian_filter(map_ori, sigma=3)
-            binary = np.ascontiguousarray(one_heatmap > thre, dtype=np.uint8)
-            # 全部小于阈值
-            if np.sum(binary) == 0:
-                all_peaks.append([0, 0])
-                continue
-            label_img, label_numbers = label(binary, return_num=True, connectivity=binary.ndim)
-            max_index = np.argmax([np.sum(map_ori[label_img == i]) for i in range(1, label_numbers + 1)]) + 1
-            label_img[label_img != max_index] = 0
-            map_ori[label_img == 0] = 0
-
-            y, x = util.npmax(map_ori)
-            all_peaks.append([x, y])
-        return np.array(all_peaks)
+        return find_hand_peaks(self.heatmap_avg.average()[:, :, :21], thre)
 
 if __name__ == "__main__":
     hand_estimation = Hand('../model/hand_pose_model.pth')
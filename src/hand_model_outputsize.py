@@ -1,17 +1,16 @@
-import torch
-from tqdm import tqdm
 import json
+import os
 
-from src.model import handpose_model
+from src.model import handpose_model, output_size
 
-model = handpose_model()
+# writes hand_model_output_size.json, the output height of handpose_model for the
+# square input sizes 10 - 999. the sizes are computed with model.output_size from
+# the layers of the network instead of running it. run from the project root:
+#   python -m src.hand_model_outputsize
 
 size = {}
-for i in tqdm(range(10, 1000)):
-    data = torch.randn(1, 3, i, i)
-    if torch.cuda.is_available():
-        data = data.cuda()
-    size[i] = model(data).size(2)
+for i in range(10, 1000):
+    size[i] = output_size(handpose_model, i, i)[0]
 
-with open('hand_model_output_size.json') as f:
-    json.dump(size, f)
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hand_model_output_size.json'), 'w') as f:
+    json.dump(size, f, indent=4, separators=(',', ':'))
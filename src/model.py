@@ -1,3 +1,4 @@
+import functools
 import torch
 from collections import OrderedDict
 
@@ -21,9 +22,20 @@ def make_layers(block, no_relu_layers):
 
     return nn.Sequential(OrderedDict(layers))
 
+def check_stages(stages):
+    if not 1 <= stages <= 6:
+        raise ValueError('stages must be between 1 and 6, got %r' % (stages,))
+
+# stages (1 - 6) stops the forward after that refinement stage and returns its
+# outputs, the weights of all the stages are still created so the state dict loads
 class bodypose_model(nn.Module):
-    def __init__(self):
+    # blocks setting the output size, see output_size
+    sizing_blocks = ['model0', 'model1_1']
+
+    def __init__(self, stages=6):
         super(bodypose_model, self).__init__()
+        check_stages(stages)
+        self.stages = stages
 
         # these layers have no relu layer
         no_relu_layers = ['conv5_5_CPM_L1', 'conv5_5_CPM_L2', 'Mconv7_stage2_L1',\
@@ -117,22 +129,32 @@ class bodypose_model(nn.Module):
 
         out1_1 = self.model1_1(out1)
         out1_2 = self.model1_2(out1)
+        if self.stages == 1:
+            return out1_1, out1_2
         out2 = torch.cat([out1_1, out1_2, out1], 1)
 
         out2_1 = self.model2_1(out2)
         out2_2 = self.model2_2(out2)
+        if self.stages == 2:
+            return out2_1, out2_2
         out3 = torch.cat([out2_1, out2_2, out1], 1)
 
         out3_1 = self.model3_1(out3)
         out3_2 = self.model3_2(out3)
+        if self.stages == 3:
+            return out3_1, out3_2
         out4 = torch.cat([out3_1, out3_2, out1], 1)
 
         out4_1 = self.model4_1(out4)
         out4_2 = self.model4_2(out4)
+        if self.stages == 4:
+            return out4_1, out4_2
         out5 = torch.cat([out4_1, out4_2, out1], 1)
 
         out5_1 = self.model5_1(out5)
         out5_2 = self.model5_2(out5)
+        if self.stages == 5:
+            return out5_1, out5_2
         out6 = torch.cat([out5_1, out5_2, out1], 1)
 
         out6_1 = self.model6_1(out6)
@@ -140,9 +162,14 @@ class bodypose_model(nn.Module):
 
         return out6_1, out6_2
 
+# stages (1 - 6) stops the forward after that stage, see bodypose_model
 class handpose_model(nn.Module):
-    def __init__(self):
+    sizing_blocks = ['model1_0', 'model1_1']
+
+    def __init__(self, stages=6):
         super(handpose_model, self).__init__()
+        check_stages(stages)
+        self.stages = stages
 
         # these layers have no relu layer
         no_relu_layers = ['conv6_2_CPM', 'Mconv7_stage2', 'Mconv7_stage3',\
@@ -204,16 +231,67 @@ class handpose_model(nn.Module):
     def forward(self, x):
         out1_0 = self.model1_0(x)
         out1_1 = self.model1_1(out1_0)
+        if self.stages == 1:
+            return out1_1
         concat_stage2 = torch.cat([out1_1, out1_0], 1)
         out_stage2 = self.model2(concat_stage2)
+        if self.stages == 2:
+            return out_stage2
         concat_stage3 = torch.cat([out_stage2, out1_0], 1)
         out_stage3 = self.model3(concat_stage3)
+        if self.stages == 3:
+            return out_stage3
         concat_stage4 = torch.cat([out_stage3, out1_0], 1)
         out_stage4 = self.model4(concat_stage4)
+        if self.stages == 4:
+            return out_stage4
         concat_stage5 = torch.cat([out_stage4, out1_0], 1)
         out_stage5 = self.model5(concat_stage5)
+        if self.stages == 5:
+            return out_stage5
         concat_stage6 = torch.cat([out_stage5, out1_0], 1)
         out_stage6 = self.model6(concat_stage6)
         return out_stage6
 
-
+# shape inference for bodypose_model / handpose_model without running them. the
+# output size comes from the convolutions and poolings of the backbone and the first
+# stage (sizing_blocks), every later stage keeps the size so its maps can be concatenated
+
+def pair(value):
+    return tuple(value) if isinstance(value, (tuple, list)) else (value, value)
+
+# (kernel, stride, padding, dilation, ceil_mode) of every size changing layer, read
+# from a network built on the meta device so nothing is allocated
+@functools.lru_cache()
+def layer_geometry(network):
+    with torch.device('meta'):
+        model = network()
+    geometry = []
+    for name in network.sizing_blocks:
+        for layer in getattr(model, name):
+            if isinstance(layer, (nn.Conv2d, nn.MaxPool2d)):
+                geometry.append((pair(layer.kernel_size), pair(layer.stride), pair(layer.padding),
+                                 pair(layer.dilation), getattr(layer, 'ceil_mode', False)))
+    return geometry
+
+# height, width of the maps network outputs for a height x width input
+def output_size(network, height, width):
+    size = [height, width]
+    for kernel, stride, padding, dilation, ceil_mode in layer_geometry(network):
+        for i in range(2):
+            span = size[i] + 2 * padding[i] - dilation[i] * (kernel[i] - 1) - 1
+            size[i] = (-(-span // stride[i]) if ceil_mode else span // stride[i]) + 1
+    return tuple(size)
+
+# input pixels per output pixel
+def output_stride(network):
+    stride = 1
+    for kernel, layer_stride, padding, dilation, ceil_mode in layer_geometry(network):
+        stride *= layer_stride[0]
+    return stride
+
+# smallest height, width at least the given ones that are multiples of the stride,
+# the network maps them to exactly height / stride x width / stride
+def input_size(network, height, width):
+    stride = output_stride(network)
+    return height + -height % stride, width + -width % stride
@@ -0,0 +1,66 @@
+import contextlib
+import os
+
+import torch
+import torch.nn as nn
+from torch.ao import quantization
+
+# post-training static int8 quantization of bodypose_model / handpose_model on the cpu.
+# every block built by make_layers gets its conv + relu pairs fused and is wrapped in
+# quant / dequant stubs, so the torch.cat between the stages stays in float and the
+# forward of the models is unchanged
+
+images = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'images')
+# bundled images used to calibrate when none are given
+body_calibration_images = [os.path.join(images, 'ski.jpg'), os.path.join(images, 'demo.jpg')]
+hand_calibration_images = [os.path.join(images, 'hand.jpg')]
+
+
+# conv + relu pairs named by make_layers ('conv1_1', 'relu_conv1_1')
+def fuse_block(block):
+    names = [name for name, module in block.named_children()]
+    pairs = [[name, 'relu_' + name] for name in names if 'relu_' + name in names]
+    return quantization.fuse_modules(block, pairs) if pairs else block
+
+# int8 engines in order of preference, x86 / fbgemm on intel and amd, qnnpack on arm
+preferred_engines = ['x86', 'fbgemm', 'qnnpack']
+
+# the engine already selected when it is one of preferred_engines, else the first
+# one this torch build supports
+def default_engine():
+    supported = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine in preferred_engines:
+        return torch.backends.quantized.engine
+    for engine in preferred_engines:
+        if engine in supported:
+            return engine
+    raise RuntimeError('no int8 quantization engine in this torch build (supported: %s)' % supported)
+
+# the weights are packed for the engine selected while converting, it is only
+# switched for that and restored afterwards
+@contextlib.contextmanager
+def selected_engine(engine):
+    previous = torch.backends.quantized.engine
+    torch.backends.quantized.engine = engine
+    try:
+        yield
+    finally:
+        torch.backends.quantized.engine = previous
+
+# fuse, wrap and add the observers to the blocks of a float model, calibrate it by
+# running it on representative inputs, then convert it. engine defaults to default_engine()
+def prepare(model, engine=None):
+    engine = engine or default_engine()
+    model = model.cpu().eval()
+    for name, block in list(model.named_children()):
+        if isinstance(block, nn.Sequential):
+            wrapped = nn.Sequential(quantization.QuantStub(), fuse_block(block), quantization.DeQuantStub())
+            wrapped.qconfig = quantization.get_default_qconfig(engine)
+            setattr(model, name, wrapped)
+    model = quantization.prepare(model)
+    model.quantized_engine = engine
+    return model
+
+def convert(model):
+    with selected_engine(model.quantized_engine):
+        return quantization.convert(model.eval())
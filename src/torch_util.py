@@ -0,0 +1,157 @@
+import math
+from collections import OrderedDict
+import numpy as np
+from scipy import ndimage
+import torch
+import torch.nn.functional as F
+
+# torch versions of the heatmap post-processing, everything stays on the device
+# of the network output and only the peaks are copied back to the host
+
+
+# upsample a 1 x C x h x w network output by stride, remove the padding and
+# resize it to the original image, returns C x H x W
+def resize_output(output, stride, padded_shape, pad, ori_shape):
+    maps = F.interpolate(output, scale_factor=stride, mode='bicubic', align_corners=False)
+    maps = maps[:, :, :padded_shape[0] - pad[2], :padded_shape[1] - pad[3]]
+    maps = F.interpolate(maps, size=(ori_shape[0], ori_shape[1]), mode='bicubic', align_corners=False)
+    return maps[0]
+
+# device version of util.MapAccumulator, averages channels x H x W maps over the
+# scales in a buffer kept per image size and device instead of a new one every frame
+class MapAccumulator(object):
+    def __init__(self, channels, max_sizes=4):
+        self.channels = channels
+        self.max_sizes = max_sizes
+        self.buffers = OrderedDict()
+        self.buffer = None
+        self.count = 0
+
+    def reset(self, height, width, device):
+        key = (height, width, torch.device(device))
+        if key in self.buffers:
+            self.buffers.move_to_end(key)
+        else:
+            self.buffers[key] = torch.empty((self.channels, height, width), device=device)
+            if len(self.buffers) > self.max_sizes:
+                self.buffers.popitem(last=False)
+        self.buffer = self.buffers[key]
+        self.buffer.zero_()
+        self.count = 0
+        return self.buffer
+
+    def add(self, maps):
+        self.buffer += maps
+        self.count += 1
+
+    # the buffer is only valid until the next reset
+    def average(self):
+        if self.count > 1:
+            self.buffer *= 1.0 / self.count
+        return self.buffer
+
+# same kernel as scipy.ndimage.gaussian_filter
+def gaussian_kernel(sigma, truncate=4.0, device=None, dtype=torch.float32):
+    radius = int(truncate * sigma + 0.5)
+    x = torch.arange(-radius, radius + 1, device=device, dtype=torch.float64)
+    kernel = torch.exp(-0.5 / (sigma * sigma) * x * x)
+    return (kernel / kernel.sum()).to(dtype)
+
+# indices padding a length n axis by radius on both sides the way scipy's
+# 'reflect' mode does (d c b a | a b c d | d c b a)
+def reflect_index(n, radius, device=None):
+    index = torch.arange(-radius, n + radius, device=device) % (2 * n)
+    return torch.where(index >= n, 2 * n - 1 - index, index)
+
+# blur every channel of a C x H x W tensor, matches gaussian_filter(map, sigma)
+def gaussian_blur(maps, sigma=3, truncate=4.0):
+    kernel = gaussian_kernel(sigma, truncate, maps.device, maps.dtype)
+    radius = (len(kernel) - 1) // 2
+    channels, height, width = maps.shape
+    maps = maps.unsqueeze(1)
+    maps = maps.index_select(2, reflect_index(height, radius, maps.device))
+    maps = F.conv2d(maps, kernel.view(1, 1, -1, 1))
+    maps = maps.index_select(3, reflect_index(width, radius, maps.device))
+    maps = F.conv2d(maps, kernel.view(1, 1, 1, -1))
+    return maps.squeeze(1)
+
+# body peaks, same result structure as body.find_peaks
+def find_peaks(maps_ori, thre1=0.1):
+    maps = gaussian_blur(maps_ori, sigma=3)
+
+    peaks_binary = maps > thre1
+    peaks_binary[:, 1:, :] &= maps[:, 1:, :] >= maps[:, :-1, :]
+    peaks_binary[:, :-1, :] &= maps[:, :-1, :] >= maps[:, 1:, :]
+    peaks_binary[:, :, 1:] &= maps[:, :, 1:] >= maps[:, :, :-1]
+    peaks_binary[:, :, :-1] &= maps[:, :, :-1] >= maps[:, :, 1:]
+
+    parts, ys, xs = torch.nonzero(peaks_binary, as_tuple=True)
+    scores = maps_ori[parts, ys, xs]
+    parts, ys, xs, scores = [t.cpu().numpy() for t in (parts, ys, xs, scores)]
+    scores = scores.astype(np.float64)
+
+    counts = np.bincount(parts, minlength=maps.shape[0]).tolist()
+    all_peaks = []
+    peak_counter = 0
+    for part in range(maps.shape[0]):
+        peak_slice = slice(peak_counter, peak_counter + counts[part])
+        all_peaks.append(list(zip(xs[peak_slice], ys[peak_slice], scores[peak_slice],
+                                  range(peak_slice.start, peak_slice.stop))))  # note reverse
+        peak_counter += counts[part]
+    return all_peaks
+
+# label the 8-connected components of every channel of a C x H x W mask by
+# propagating the largest pixel id with 3 x 3 max pooling, background is 0.
+# every step costs a host sync and grows the labels by one pixel, blobs that are
+# not labeled after max_iterations steps are labeled on the host instead
+def label_components(binary, max_iterations=64):
+    channels, height, width = binary.shape
+    ids = torch.arange(1, height * width + 1, device=binary.device, dtype=torch.float32)
+    labels = torch.where(binary, ids.view(1, height, width), torch.zeros((), device=binary.device))
+    # float32 keeps the ids exact up to 2 ** 24 pixels
+    for _ in range(max_iterations):
+        grown = F.max_pool2d(labels.unsqueeze(1), 3, stride=1, padding=1).squeeze(1)
+        grown = torch.where(binary, grown, labels)
+        if torch.equal(grown, labels):
+            return labels.long()
+        labels = grown
+    structure = np.ones((3, 3), dtype=bool)
+    labels = np.stack([ndimage.label(channel, structure)[0] for channel in binary.cpu().numpy()])
+    return torch.from_numpy(labels).to(device=binary.device, dtype=torch.long)
+
+# hand peaks, for every channel the maximum of the blob with the largest sum
+# of maps_ori, [0, 0] when nothing is above thre, returns a C x 2 array of x, y
+# and the mask of the channels that were found
+def find_hand_peaks(maps_ori, thre=0.05):
+    channels, height, width = maps_ori.shape
+    maps = gaussian_blur(maps_ori, sigma=3)
+    binary = maps > thre
+    labels = label_components(binary).view(channels, -1)
+
+    maps_flat = maps_ori.reshape(channels, -1)
+    # labels that are not used keep -inf, so a blob wins even when every sum is negative
+    sums = torch.full((channels, height * width + 1), -math.inf, device=maps_ori.device, dtype=maps_ori.dtype)
+    sums.scatter_reduce_(1, labels, maps_flat, reduce='sum', include_self=False)
+    sums[:, 0] = -math.inf
+    best = sums.argmax(1, keepdim=True)
+
+    masked = torch.where(labels == best, maps_flat, torch.zeros_like(maps_flat))
+    index = masked.argmax(1)
+    peaks = torch.stack([index % width, index // width], 1)
+    found = binary.view(channels, -1).any(1)
+    peaks[~found] = 0
+    return peaks.cpu().numpy(), found.cpu().numpy()
+
+# H x W x 2 view of two channels of a C x H x W device tensor, indexing it with
+# integer arrays gathers on the device and returns a numpy array
+class DeviceMaps(object):
+    def __init__(self, maps, channels):
+        self.maps = maps
+        self.channels = channels
+
+    def __getitem__(self, index):
+        ys, xs = [torch.as_tensor(i, device=self.maps.device) for i in index]
+        # only the two channels are gathered and copied to the host
+        channels = torch.as_tensor(self.channels, device=self.maps.device).view((-1,) + (1,) * ys.dim())
+        samples = self.maps[channels, ys, xs]
+        return np.moveaxis(samples.cpu().numpy().astype(np.float64), 0, -1)
@@ -1,6 +1,12 @@
 import numpy as np
 import math
 import cv2
+import hashlib
+import json
+import os
+import warnings
+from collections import OrderedDict
+import torch
 import matplotlib
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
@@ -8,6 +14,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import cv2
 
+from src.model import input_size
+
 
 def padRightDownCorner(img, stride, padValue):
     h = img.shape[0]
@@ -31,6 +39,89 @@ def padRightDownCorner(img, stride, padValue):
 
     return img_padded, pad
 
+# network inputs N x 3 x H x W, normalized float32, padded right and down to the
+# stride aligned size model.input_size picks for network (bodypose_model /
+# handpose_model). the buffer of each shape is kept for the next calls instead
+# of padding, converting and transposing copies of every image; it is pinned when
+# the model runs on cuda so the copy to the device is faster
+class InputBuffer(object):
+    def __init__(self, network, padValue, device='cpu', max_sizes=8):
+        self.network = network
+        self.padValue = padValue
+        self.device = torch.device(device)
+        self.max_sizes = max_sizes
+        self.buffers = OrderedDict()
+
+    def get(self, n, height, width):
+        key = (n, height, width)
+        if key in self.buffers:
+            self.buffers.move_to_end(key)
+        else:
+            if self.device.type == 'cuda':
+                tensor = torch.empty((n, 3, height, width), dtype=torch.float32, pin_memory=True)
+            else:
+                tensor = torch.empty((n, 3, height, width), dtype=torch.float32)
+            self.buffers[key] = tensor
+            if len(self.buffers) > self.max_sizes:
+                self.buffers.popitem(last=False)
+        return self.buffers[key]
+
+    # write the H x W x 3 uint8 images into one input tensor on the model device,
+    # returns it with the padded shape and the pad of every image in the
+    # padRightDownCorner layout. the tensor is only valid until the next fill
+    def fill(self, images):
+        height = max(image.shape[0] for image in images)
+        width = max(image.shape[1] for image in images)
+        height, width = input_size(self.network, height, width)
+
+        tensor = self.get(len(images), height, width)
+        im = tensor.numpy()
+        pad_value = np.float32(self.padValue / 256 - 0.5)
+        pads = []
+        for n, image in enumerate(images):
+            h, w = image.shape[:2]
+            np.multiply(np.transpose(image, (2, 0, 1)), np.float32(1 / 256), out=im[n, :, :h, :w], dtype=np.float32)
+            im[n, :, :h, :w] -= 0.5
+            im[n, :, h:, :] = pad_value
+            im[n, :, :h, w:] = pad_value
+            pads.append([0, 0, height - h, width - w])
+
+        return tensor.to(self.device), (height, width, 3), pads
+
+# average of H x W x channels maps over the scales. the float32 buffer of each image
+# size is kept for the next calls instead of allocating a new one every frame,
+# the least recently used size is dropped past max_sizes (hand crops vary in size)
+class MapAccumulator(object):
+    def __init__(self, channels, max_sizes=4):
+        self.channels = channels
+        self.max_sizes = max_sizes
+        self.buffers = OrderedDict()
+        self.buffer = None
+        self.count = 0
+
+    def reset(self, height, width):
+        key = (height, width)
+        if key in self.buffers:
+            self.buffers.move_to_end(key)
+        else:
+            self.buffers[key] = np.empty((height, width, self.channels), dtype=np.float32)
+            if len(self.buffers) > self.max_sizes:
+                self.buffers.popitem(last=False)
+        self.buffer = self.buffers[key]
+        self.buffer.fill(0)
+        self.count = 0
+        return self.buffer
+
+    def add(self, maps):
+        self.buffer += maps
+        self.count += 1
+
+    # the buffer is only valid until the next reset
+    def average(self):
+        if self.count > 1:
+            self.buffer *= 1.0 / self.count
+        return self.buffer
+
 # transfer caffe model to pytorch which will match the layer name
 def transfer(model, model_weights):
     transfered_model_weights = {}
@@ -38,6 +129,70 @@ def transfer(model, model_weights):
         transfered_model_weights[weights_name] = model_weights['.'.join(weights_name.split('.')[1:])]
     return transfered_model_weights
 
+def file_hash(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# hash of the source weights, remembered in cache_dir/index.json by path, size and
+# mtime so an unchanged file is not read again
+def cached_hash(path, cache_dir):
+    index_path = os.path.join(cache_dir, 'index.json')
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        index = {}
+    entry = index.get(key)
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry[2]
+    digest = file_hash(path)
+    index[key] = [stat.st_size, stat.st_mtime_ns, digest]
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+    write_atomic(index_path, write)
+    return digest
+
+# write through a temporary file so concurrent workers never read a partial file
+def write_atomic(path, write):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# load the caffe converted weights of model_path into model. the transfered state dict
+# is cached in cache_dir (default model_path's directory/cache) keyed by the hash of
+# model_path and memory mapped on the next loads, the parameters of the model then
+# share the pages of the cache file with every other process loading it. when the
+# cache cannot be written (read-only install) the weights are converted on every load
+def load_weights(model, model_path, cache_dir=None):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(model_path)), 'cache')
+    os.stat(model_path)  # a missing model_path is an error, not a cache problem
+    model_dict = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_path = os.path.join(cache_dir, '%s_%s.pth' % (cached_hash(model_path, cache_dir), type(model).__name__))
+        if not os.path.exists(cache_path):
+            model_dict = transfer(model, torch.load(model_path, map_location='cpu'))
+            write_atomic(cache_path, lambda tmp: torch.save(model_dict, tmp))
+    except OSError as e:
+        warnings.warn('not caching the weights of %s: %s' % (model_path, e))
+        if model_dict is None:
+            model_dict = transfer(model, torch.load(model_path, map_location='cpu'))
+    else:
+        model_dict = torch.load(cache_path, map_location='cpu', mmap=True, weights_only=True)
+    model.load_state_dict(model_dict, assign=True)
+    return model
+
 # draw the body keypoint and lims
 def draw_bodypose(canvas, candidate, subset):
     stickwidth = 4
@@ -110,13 +265,15 @@ def draw_handpose_by_opencv(canvas, peaks, show_number=False):
              [10, 11], [11, 12], [0, 13], [13, 14], [14, 15], [15, 16], [0, 17], [17, 18], [18, 19], [19, 20]]
     # cv2.rectangle(canvas, (x, y), (x+w, y+w), (0, 255, 0), 2, lineType=cv2.LINE_AA)
     # cv2.putText(canvas, 'left' if is_left else 'right', (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    # opencv draws on integer points, the native_resolution peaks are floats
+    points = np.rint(peaks).astype(int)
     for ie, e in enumerate(edges):
         if np.sum(np.all(peaks[e], axis=1)==0)==0:
-            x1, y1 = peaks[e[0]]
-            x2, y2 = peaks[e[1]]
+            x1, y1 = points[e[0]]
+            x2, y2 = points[e[1]]
             cv2.line(canvas, (x1, y1), (x2, y2), matplotlib.colors.hsv_to_rgb([ie/float(len(edges)), 1.0, 1.0])*255, thickness=2)
 
-    for i, keyponit in enumerate(peaks):
+    for i, keyponit in enumerate(points):
         x, y = keyponit
         cv2.circle(canvas, (x, y), 4, (0, 0, 255), thickness=-1)
         if show_number:
@@ -196,3 +353,46 @@ def npmax(array):
     i = arrayvalue.argmax()
     j = arrayindex[i]
     return i, j
+
+# sub-pixel position of the integer peaks (xs, ys) of a 2d array, from a quadratic
+# through the neighbours along each axis; peaks on the border are not moved
+def refine_peak(array, xs, ys):
+    xs = np.asarray(xs, dtype=int)
+    ys = np.asarray(ys, dtype=int)
+    h, w = array.shape
+    center = array[ys, xs]
+
+    def offset(before, after, inside):
+        curvature = before - 2 * center + after
+        delta = np.zeros(len(center))
+        valid = inside & (curvature < 0)
+        delta[valid] = 0.5 * (before[valid] - after[valid]) / curvature[valid]
+        return np.clip(delta, -0.5, 0.5)
+
+    x_inside = (xs > 0) & (xs < w - 1)
+    y_inside = (ys > 0) & (ys < h - 1)
+    dx = offset(array[ys, np.maximum(xs - 1, 0)], array[ys, np.minimum(xs + 1, w - 1)], x_inside)
+    dy = offset(array[np.maximum(ys - 1, 0), xs], array[np.minimum(ys + 1, h - 1), xs], y_inside)
+    return xs + dx, ys + dy
+
+# average network outputs of several scales on the grid of the largest scale,
+# without upsampling them to the image size. every output is (maps..., padded_shape,
+# pad, scale) with 1 x C x h x w maps; returns the h x w x C averages and that scale
+def native_average(outputs, stride):
+    averages = None
+    largest = max(range(len(outputs)), key=lambda m: outputs[m][-1])
+    for m in [largest] + [m for m in range(len(outputs)) if m != largest]:
+        padded_shape, pad = outputs[m][-3:-1]
+        # keep the cells covering the image, not the padding
+        rows = -(-(padded_shape[0] - pad[2]) // stride)
+        cols = -(-(padded_shape[1] - pad[3]) // stride)
+        maps = [np.transpose(np.squeeze(output.cpu().numpy(), 0), (1, 2, 0))[:rows, :cols, :]
+                for output in outputs[m][:-3]]
+        if averages is None:
+            averages = [np.zeros(x.shape, dtype=np.float32) for x in maps]
+        else:
+            size = (averages[0].shape[1], averages[0].shape[0])
+            maps = [cv2.resize(x, size, interpolation=cv2.INTER_CUBIC) for x in maps]
+        for average, x in zip(averages, maps):
+            average += x / len(outputs)
+    return averages, outputs[largest][-1]
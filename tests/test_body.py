@@ -0,0 +1,229 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from scipy.ndimage import gaussian_filter
+
+from src import body
+
+
+def random_peaks(rng, n, height, width, start_id=0):
+    return [(int(rng.integers(width)), int(rng.integers(height)), float(rng.random()), start_id + i)
+            for i in range(n)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_score_limb_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    height, width = 60, 80
+    # a smooth field so that some pairs pass both criteria
+    score_mid = np.empty((height, width, 2))
+    score_mid[..., 0] = rng.uniform(0.2, 1.0)
+    score_mid[..., 1] = rng.uniform(-1.0, 1.0)
+    score_mid += rng.normal(scale=0.3, size=score_mid.shape)
+    candA = random_peaks(rng, 6, height, width)
+    candB = random_peaks(rng, 5, height, width, start_id=6)
+
+    expected = body.score_limb_loop(candA, candB, score_mid, height)
+    result = body.score_limb(candA, candB, score_mid, height)
+    assert len(expected) > 0
+    assert [c[:2] for c in result] == [c[:2] for c in expected]
+    np.testing.assert_allclose([c[2:] for c in result], [c[2:] for c in expected])
+
+
+@pytest.mark.parametrize('nA, nB', [(0, 0), (0, 3), (3, 0)])
+def test_score_limb_empty_candidates(nA, nB):
+    rng = np.random.default_rng(0)
+    score_mid = rng.random((20, 20, 2))
+    candA = random_peaks(rng, nA, 20, 20)
+    candB = random_peaks(rng, nB, 20, 20, start_id=nA)
+    assert body.score_limb(candA, candB, score_mid, 20) == []
+    assert body.score_limb_loop(candA, candB, score_mid, 20) == []
+
+
+# the per-part, shifted copy peak finder find_peaks replaced
+def find_peaks_reference(heatmaps, thre1=0.1):
+    all_peaks = []
+    peak_counter = 0
+    for part in range(heatmaps.shape[2]):
+        map_ori = heatmaps[:, :, part]
+        one_heatmap = gaussian_filter(map_ori, sigma=3)
+        map_left = np.zeros(one_heatmap.shape)
+        map_left[1:, :] = one_heatmap[:-1, :]
+        map_right = np.zeros(one_heatmap.shape)
+        map_right[:-1, :] = one_heatmap[1:, :]
+        map_up = np.zeros(one_heatmap.shape)
+        map_up[:, 1:] = one_heatmap[:, :-1]
+        map_down = np.zeros(one_heatmap.shape)
+        map_down[:, :-1] = one_heatmap[:, 1:]
+        peaks_binary = np.logical_and.reduce(
+            (one_heatmap >= map_left, one_heatmap >= map_right, one_heatmap >= map_up,
+             one_heatmap >= map_down, one_heatmap > thre1))
+        peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0]))
+        all_peaks.append([(x, y, map_ori[y, x], peak_counter + i) for i, (x, y) in enumerate(peaks)])
+        peak_counter += len(peaks)
+    return all_peaks
+
+
+def test_find_peaks_matches_reference():
+    rng = np.random.default_rng(0)
+    height, width = 48, 64
+    heatmaps = np.zeros((height, width, 6))
+    # random blobs
+    for part in range(3):
+        for _ in range(4):
+            heatmaps[rng.integers(height), rng.integers(width), part] = rng.uniform(5, 20)
+    # peaks on the corners and edges
+    heatmaps[0, 0, 3] = heatmaps[-1, -1, 3] = heatmaps[0, width // 2, 3] = heatmaps[height // 2, -1, 3] = 10
+    # plateaus, a constant channel and a flat topped ridge across the map
+    heatmaps[:, :, 4] = 0.5
+    heatmaps[10:20, :, 5] = 1.0
+    # nothing above the threshold
+    heatmaps[:, :, 2] *= 0
+
+    expected = find_peaks_reference(heatmaps)
+    result = body.find_peaks(heatmaps)
+    assert len(expected[4]) == height * width
+    assert len(expected[5]) > width
+    assert expected[2] == []
+    assert [[p[:2] + p[3:] for p in peaks] for peaks in result] == \
+        [[p[:2] + p[3:] for p in peaks] for peaks in expected]
+    for peaks, reference in zip(result, expected):
+        np.testing.assert_allclose([p[2] for p in peaks], [p[2] for p in reference])
+
+
+# the np.vstack / np.delete builder assemble_people replaced, except that it keeps
+# the first two matching rows where the original raised an IndexError on a third
+def assemble_people_reference(candidate, connection_all, special_k):
+    subset = -1 * np.ones((0, 20))
+    for k in range(len(body.mapIdx)):
+        if k in special_k:
+            continue
+        partAs = connection_all[k][:, 0]
+        partBs = connection_all[k][:, 1]
+        indexA, indexB = np.array(body.limbSeq[k]) - 1
+        for i in range(len(connection_all[k])):
+            subset_idx = [j for j in range(len(subset))
+                          if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]][:2]
+            found = len(subset_idx)
+            if found == 1:
+                j = subset_idx[0]
+                if subset[j][indexB] != partBs[i]:
+                    subset[j][indexB] = partBs[i]
+                    subset[j][-1] += 1
+                    subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+            elif found == 2:
+                j1, j2 = subset_idx
+                membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
+                if len(np.nonzero(membership == 2)[0]) == 0:
+                    subset[j1][:-2] += (subset[j2][:-2] + 1)
+                    subset[j1][-2:] += subset[j2][-2:]
+                    subset[j1][-2] += connection_all[k][i][2]
+                    subset = np.delete(subset, j2, 0)
+                else:
+                    subset[j1][indexB] = partBs[i]
+                    subset[j1][-1] += 1
+                    subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+            elif not found and k < 17:
+                row = -1 * np.ones(20)
+                row[indexA] = partAs[i]
+                row[indexB] = partBs[i]
+                row[-1] = 2
+                row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
+                subset = np.vstack([subset, row])
+    deleteIdx = [i for i in range(len(subset)) if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4]
+    return np.delete(subset, deleteIdx, axis=0)
+
+
+# random peaks for the 18 parts and random one-to-one connections for every limb,
+# the same structures Body.connect hands to assemble_people
+def random_connections(rng, max_peaks=4):
+    all_peaks = []
+    peak_counter = 0
+    for part in range(18):
+        n = int(rng.integers(max_peaks + 1))
+        all_peaks.append([(0, 0, float(rng.random()), peak_counter + i) for i in range(n)])
+        peak_counter += n
+    candidate = np.array([item for sublist in all_peaks for item in sublist])
+
+    connection_all = []
+    special_k = []
+    for k in range(len(body.mapIdx)):
+        candA = all_peaks[body.limbSeq[k][0] - 1]
+        candB = all_peaks[body.limbSeq[k][1] - 1]
+        if len(candA) == 0 or len(candB) == 0:
+            special_k.append(k)
+            connection_all.append([])
+            continue
+        n = int(rng.integers(min(len(candA), len(candB)) + 1))
+        ia = rng.permutation(len(candA))[:n]
+        ib = rng.permutation(len(candB))[:n]
+        connection_all.append(np.array([[candA[i][3], candB[j][3], rng.random(), i, j]
+                                        for i, j in zip(ia, ib)]).reshape(-1, 5))
+    return candidate, connection_all, special_k
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_assemble_people_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    candidate, connection_all, special_k = random_connections(rng)
+    expected = assemble_people_reference(candidate, connection_all, special_k)
+    np.testing.assert_allclose(body.assemble_people(candidate, connection_all, special_k), expected)
+
+
+def test_assemble_people_three_matching_rows():
+    # peaks: necks 0-2, r shoulders 3-5, l shoulder 6, r elbows 7-9, r wrists 10-12
+    parts = [1] * 3 + [2] * 3 + [5] + [3] * 3 + [4] * 3
+    candidate = np.array([[0, 0, 0.9, i] for i in range(len(parts))])
+    connection_all = [[] for _ in body.mapIdx]
+    connection_all[0] = np.array([[0, 3, 0.9, 0, 0], [1, 4, 0.9, 1, 1], [2, 5, 0.9, 2, 2]])
+    # the l shoulder lands in person 2 and then in person 0, so the last
+    # connection matches all three people
+    connection_all[1] = np.array([[2, 6, 0.9, 2, 0], [0, 6, 0.9, 0, 0], [1, 6, 0.9, 1, 0]])
+    connection_all[2] = np.array([[3, 7, 0.9, 0, 0], [4, 8, 0.9, 1, 1], [5, 9, 0.9, 2, 2]])
+    connection_all[3] = np.array([[7, 10, 0.9, 0, 0], [8, 11, 0.9, 1, 1], [9, 12, 0.9, 2, 2]])
+    special_k = [k for k in range(len(body.mapIdx)) if len(connection_all[k]) == 0]
+
+    expected = assemble_people_reference(candidate, connection_all, special_k)
+    assert len(expected) == 3
+    np.testing.assert_allclose(body.assemble_people(candidate, connection_all, special_k), expected)
+
+
+# stands in for the network: every output cell only sees its own 8 x 8 input block,
+# and the padding (0 once normalized) and black pixels give 0, so a frame gets the
+# same maps whatever size its batch is padded to
+class FakeBodyNetwork(torch.nn.Module):
+    def forward(self, data):
+        cells = F.avg_pool2d(F.relu(data), body.Body.stride)
+        heatmaps = torch.cat([cells[:, :1] * (1 + part / 19) for part in range(19)], 1)
+        pafs = torch.cat([cells[:, 1:3]] * 19, 1)
+        return pafs, heatmaps
+
+
+def body_frame(rng, height, width):
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    # the pafs point right and down in the middle of the frame
+    frame[height // 6:-height // 6, width // 6:-width // 6, 1:] = 200
+    for _ in range(6):
+        y = int(rng.integers(height // 4, 3 * height // 4))
+        x = int(rng.integers(width // 4, 3 * width // 4))
+        cv2.circle(frame, (x, y), max(height, width) // 20, (255, 200, 200), -1)
+    return frame
+
+
+@pytest.mark.parametrize('device_postprocess', [False, True])
+def test_batch_matches_single_frames(monkeypatch, device_postprocess):
+    monkeypatch.setattr(body, 'load_backend', lambda backend, path: FakeBodyNetwork())
+    estimator = body.Body('fake.pt', backend='torchscript', device_postprocess=device_postprocess,
+                          scale_search=[0.5, 1.0])
+    rng = np.random.default_rng(0)
+    frames = [body_frame(rng, 240, 320), body_frame(rng, 300, 200), body_frame(rng, 200, 180)]
+
+    expected = [estimator(frame) for frame in frames]
+    result = estimator.batch(frames, batch_size=2)
+    assert len(result) == len(frames)
+    assert sum(len(subset) for _, subset in expected) > 0
+    for (candidate, subset), (expected_candidate, expected_subset) in zip(result, expected):
+        np.testing.assert_allclose(candidate, expected_candidate, atol=1e-5)
+        np.testing.assert_allclose(subset, expected_subset, atol=1e-5)
@@ -0,0 +1,71 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from drums import HitDetector, PadLayout, mask_boxes
+
+pads_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'drum_pads.json')
+
+
+def test_mask_boxes_are_disjoint_and_cover_the_mask():
+    rng = np.random.default_rng(0)
+    mask = rng.random((40, 50)) < 0.3
+    mask[5:20, 10:30] = True
+    covered = np.zeros(mask.shape, dtype=int)
+    for x1, y1, x2, y2 in mask_boxes(mask):
+        covered[y1:y2, x1:x2] += 1
+    np.testing.assert_array_equal(covered, mask.astype(int))
+
+
+@pytest.mark.parametrize('alpha', [1.0, 0.6])
+@pytest.mark.parametrize('size', [(700, 900), (500, 600)])
+def test_draw_matches_full_frame_blend(alpha, size):
+    layout = PadLayout.from_file(pads_file, alpha=alpha)
+    frame = np.random.default_rng(0).integers(0, 255, size + (3,), dtype=np.uint8)
+    height, width = size
+    expected = cv2.add(cv2.multiply(frame, layout.inverse[:height, :width], scale=1 / 255),
+                       layout.overlay[:height, :width])
+    np.testing.assert_array_equal(layout.draw(frame.copy()), expected)
+
+
+def test_hit():
+    layout = PadLayout.from_file(pads_file)
+    assert layout.hit(100, 50)["name"] == "RIDE"
+    assert layout.hit(0, 0) is None  # on the edge
+    assert layout.hit(205, 50) is None  # between two pads
+    assert layout.hit(-1, 50) is None
+
+
+# the hits of a stick following boxes, one frame every 1 / 30 s
+def hits(boxes, **params):
+    detector = HitDetector(PadLayout.from_file(pads_file), **params)
+    return [detector.update(0, box, n / 30) for n, box in enumerate(boxes)]
+
+
+def test_strike_fires_once():
+    # down into TOM MID (y 580 - 700), then resting in it
+    result = hits([(300, y, 10, 10) for y in (450, 490, 530, 570, 590, 600, 602, 602, 602, 602)])
+    fired = [hit for hit in result if hit is not None]
+    assert len(fired) == 1
+    assert fired[0][0]["name"] == "TOM MID" and 0 < fired[0][1] <= 1
+
+
+def test_jitter_across_the_edge_does_not_retrigger():
+    # resting on the top edge of TOM MID, in and out every other frame
+    assert not any(hits([(300, 579 + (n % 2) * 3, 10, 10) for n in range(30)]))
+
+
+def test_lost_frames_do_not_retrigger():
+    assert not any(hits([(300, 600, 10, 10) if n % 5 else None for n in range(30)]))
+
+
+def test_slow_drift_into_a_pad_is_silent():
+    assert not any(hits([(300, 560 + n, 10, 10) for n in range(40)]))
+
+
+def test_leaving_the_pad_rearms_the_entry():
+    strike = [(300, y, 10, 10) for y in (450, 490, 530, 570, 590, 600)]
+    away = [(300, 450, 10, 10)] * 5
+    assert sum(hit is not None for hit in hits(strike + away + strike)) == 2
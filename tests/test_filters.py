@@ -0,0 +1,58 @@
+import numpy as np
+
+from filters import DeadBand, OneEuroFilter, WristVolumes, wrist_volume
+
+
+def test_one_euro_filter_smooths_jitter():
+    one_euro = OneEuroFilter()
+    rng = np.random.default_rng(0)
+    points = [one_euro([[100.0, 200.0]] + rng.normal(scale=2, size=(1, 2)), timestamp=n / 30) for n in range(60)]
+    assert np.std(np.array(points[30:]), axis=0).max() < 1.0
+
+
+def test_one_euro_filter_seeds_from_confident_detection():
+    one_euro = OneEuroFilter(min_score=0.3)
+    # an outlier on the first frame, then confident detections
+    points = one_euro([[0.0, 0.0], [10.0, 10.0]], [0.1, 0.9], 0.0)
+    assert one_euro.seeded.tolist() == [False, True]
+    np.testing.assert_allclose(points[1], [10, 10])
+    points = one_euro([[100.0, 50.0], [10.0, 10.0]], [0.9, 0.9], 1 / 30)
+    assert one_euro.seeded.all()
+    np.testing.assert_allclose(points[0], [100, 50])
+    # a low score keypoint holds its value once seeded
+    points = one_euro([[0.0, 0.0], [10.0, 10.0]], [0.1, 0.9], 2 / 30)
+    np.testing.assert_allclose(points[0], [100, 50])
+
+
+def test_dead_band():
+    dead_band = DeadBand(0.05)
+    assert dead_band.changed('a', 0.5)
+    assert not dead_band.changed('a', 0.52)
+    assert dead_band.changed('a', 0.6)
+    assert dead_band.changed('a', 0)
+
+
+class Player(object):
+    def __init__(self, id):
+        self.id = id
+        self.volumes = []
+
+    def set_volume(self, volume):
+        self.volumes.append(volume)
+
+
+def test_wrist_volume():
+    assert wrist_volume(450) == 0
+    assert wrist_volume(399.5) == 0.2
+    assert wrist_volume(0) == 1.0
+
+
+def test_wrist_volumes_wait_for_confident_wrists():
+    volumes = WristVolumes(right_wrist=0, left_wrist=1)
+    players = [Player(0), Player(1)]
+    assert volumes([[0, 0], [0, 450]], [0.1, 0.9], 0.0, players) is None
+    assert players[0].volumes == [] and players[1].volumes == []
+    assert volumes([[0, 300], [0, 450]], [0.9, 0.9], 1 / 30, players) == [0.4, 0]
+    assert players[0].volumes == [0.4] and players[1].volumes == [0]
+    volumes.mute(players)
+    assert players[0].volumes == [0.4, 0] and players[1].volumes == [0]
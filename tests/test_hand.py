@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from src import hand
+
+
+def test_find_hand_peaks_top_left_corner():
+    heatmaps = np.zeros((30, 30, 3))
+    heatmaps[0, 0, 0] = 5
+    heatmaps[12, 20, 1] = 5
+    peaks, found = hand.find_hand_peaks(heatmaps)
+    np.testing.assert_array_equal(peaks, [[0, 0], [20, 12], [0, 0]])
+    assert found.tolist() == [True, True, False]
+
+
+# stands in for the network: every output cell only sees its own 8 x 8 input block,
+# the keypoint maps follow the three color channels
+class FakeHandNetwork(torch.nn.Module):
+    def forward(self, data):
+        cells = F.avg_pool2d(F.relu(data), hand.Hand.stride)
+        return torch.cat([cells[:, part % 3:part % 3 + 1] * (1 + part / 22) for part in range(22)], 1)
+
+
+def fake_hand(monkeypatch, **params):
+    monkeypatch.setattr(hand, 'load_backend', lambda backend, path: FakeHandNetwork())
+    return hand.Hand('fake.pt', backend='torchscript', **params)
+
+
+@pytest.mark.parametrize('params', [{'device_postprocess': False}, {'device_postprocess': True},
+                                    {'device_postprocess': False, 'native_resolution': True}])
+def test_detect_matches_crops(monkeypatch, params):
+    estimator = fake_hand(monkeypatch, scale_search=[0.5, 1.0], **params)
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for x, y, color in [(40, 60, (255, 0, 0)), (80, 50, (0, 255, 0)), (200, 90, (0, 0, 255)), (150, 180, (255, 255, 0))]:
+        cv2.circle(frame, (x, y), 6, color, -1)
+    hands = [[10, 20, 100, False], [150, 40, 96, True], [100, 120, 120, False]]
+
+    result = estimator.detect(frame, hands)
+    assert len(result) == len(hands)
+    found_any = False
+    for peaks, (x, y, w, is_left) in zip(result, hands):
+        expected = estimator(frame[y:y + w, x:x + w])
+        found = expected.any(1)
+        found_any |= found.any()
+        np.testing.assert_allclose(peaks[found], expected[found] + [x, y], atol=1e-3)
+        np.testing.assert_array_equal(peaks[~found], 0)
+    assert found_any
+
+
+def test_detect_without_hands(monkeypatch):
+    estimator = fake_hand(monkeypatch, device_postprocess=False)
+    assert estimator.detect(np.zeros((100, 100, 3), dtype=np.uint8), []) == []
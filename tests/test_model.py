@@ -0,0 +1,12 @@
+import pytest
+import torch
+
+from src.model import bodypose_model, handpose_model
+
+
+@pytest.mark.parametrize('network', [bodypose_model, handpose_model])
+@pytest.mark.parametrize('stages', [0, 7])
+def test_stages_out_of_range(network, stages):
+    with pytest.raises(ValueError):
+        with torch.device('meta'):
+            network(stages)
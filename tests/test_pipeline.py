@@ -0,0 +1,46 @@
+import threading
+import time
+
+from pipeline import Dispatcher, LatestQueue, Stage
+
+
+def test_dispatches_in_order():
+    dispatcher = Dispatcher()
+    done = []
+    for i in range(5):
+        assert dispatcher.submit(done.append, i)
+    dispatcher.close(timeout=1)
+    assert done == list(range(5))
+    assert dispatcher.stats()["dispatched"] == 5
+
+
+def test_close_does_not_block_on_a_full_queue():
+    release = threading.Event()
+    dispatcher = Dispatcher(maxsize=2)
+    dispatcher.submit(release.wait)
+    # wait until the worker is stuck in the first output
+    while dispatcher.queue.qsize():
+        time.sleep(0.001)
+    assert dispatcher.submit(print) and dispatcher.submit(print)
+    assert not dispatcher.submit(print)
+
+    started = time.perf_counter()
+    dispatcher.close(timeout=0.05)
+    assert time.perf_counter() - started < 0.5
+    assert dispatcher.dropped == 2
+    release.set()
+    dispatcher.thread.join(1)
+    assert not dispatcher.thread.is_alive()
+
+
+def test_stage_survives_a_failing_item():
+    stop = threading.Event()
+    source, sink = LatestQueue(4), LatestQueue(4)
+    stage = Stage("half", lambda x: 1 / x, stop, source=source, sink=sink, timeout=0.01)
+    stage.start()
+    source.put(0)
+    source.put(2)
+    assert sink.get(1) == 0.5
+    assert stage.is_alive()
+    stop.set()
+    stage.join(1)
@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+pygame = pytest.importorskip('pygame')
+pytest.importorskip('pydantic')
+
+from player import MusicPlayer, SampleEngine, music_channels
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_default_kit_loads_every_pad(monkeypatch):
+    monkeypatch.chdir(root)
+    with open('drum_pads.json') as f:
+        pads = json.load(f)['pads']
+    engine = SampleEngine.from_pads(pads, voices=2)
+    assert all(pad['name'] in engine for pad in pads)
+    assert engine.play(pads[0]['name']) is not None
+
+
+def test_from_pads_fails_when_no_sample_loads(tmp_path):
+    pads = [{'name': 'KICK', 'sample': str(tmp_path / 'kick.wav')}]
+    with pytest.raises(FileNotFoundError):
+        SampleEngine.from_pads(pads, voices=2)
+
+
+def test_pads_without_samples_are_allowed():
+    assert len(SampleEngine.from_pads([{'name': 'KICK', 'key': 'a'}], voices=2).sounds) == 0
+
+
+def test_music_players_do_not_take_sample_voices(monkeypatch):
+    monkeypatch.chdir(root)
+    pygame.mixer.init()
+    pygame.mixer.set_num_channels(8)
+    engine = SampleEngine({'KICK': 'samples/crash.wav'}, voices=2)
+    # the next player plays on channel 8, the first free one before the engine
+    monkeypatch.setattr(MusicPlayer, 'instance_count', 7)
+    player = MusicPlayer()
+    engine.play('KICK')
+    engine.play('KICK')
+    # both voices are busy, the player's channel is not one of them
+    assert all(channel.get_busy() for channel in engine.channels)
+    assert not player.channel.get_busy()
+    engine.stop()
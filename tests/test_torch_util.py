@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from scipy.ndimage import gaussian_filter
+
+from src import body, torch_util
+
+
+def test_find_hand_peaks_negative_blob():
+    # the whole map is one blob above the threshold with a negative raw sum
+    maps = torch.full((1, 20, 30), -0.5)
+    maps[0, 12, 7] = -0.1
+    peaks, found = torch_util.find_hand_peaks(maps, thre=-1)
+    np.testing.assert_array_equal(peaks[0], [7, 12])
+    assert found.tolist() == [True]
+
+
+def test_find_hand_peaks_nothing_found():
+    peaks, found = torch_util.find_hand_peaks(torch.zeros((3, 20, 20)))
+    np.testing.assert_array_equal(peaks, np.zeros((3, 2)))
+    assert not found.any()
+
+
+def test_find_hand_peaks_top_left_corner():
+    maps = torch.zeros((2, 30, 30))
+    maps[0, 0, 0] = 5
+    peaks, found = torch_util.find_hand_peaks(maps)
+    np.testing.assert_array_equal(peaks, np.zeros((2, 2)))
+    assert found.tolist() == [True, False]
+
+
+def test_device_maps_gathers_channels():
+    maps = torch.rand((5, 12, 16))
+    ys = np.array([[0, 3, 11], [5, 5, 7]])
+    xs = np.array([[1, 15, 2], [0, 9, 4]])
+    samples = torch_util.DeviceMaps(maps, [3, 1])[ys, xs]
+    expected = np.moveaxis(maps.numpy()[[3, 1]][:, ys, xs], 0, -1)
+    assert samples.shape == (2, 3, 2)
+    np.testing.assert_allclose(samples, expected)
+
+
+def test_map_accumulator_reuses_buffer():
+    accumulator = torch_util.MapAccumulator(3)
+    buffer = accumulator.reset(4, 5, 'cpu')
+    accumulator.add(torch.ones((3, 4, 5)))
+    accumulator.add(torch.full((3, 4, 5), 3.0))
+    torch.testing.assert_close(accumulator.average(), torch.full((3, 4, 5), 2.0))
+    assert accumulator.reset(4, 5, 'cpu') is buffer
+    assert not buffer.any()
+
+
+@pytest.mark.parametrize('shape', [(3, 40, 33), (2, 9, 64)])
+def test_gaussian_blur_matches_scipy(shape):
+    maps = np.random.default_rng(0).random(shape).astype(np.float32)
+    expected = gaussian_filter(maps, sigma=(0, 3, 3), mode='reflect')
+    np.testing.assert_allclose(torch_util.gaussian_blur(torch.from_numpy(maps)).numpy(), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_find_peaks_matches_body(seed):
+    rng = np.random.default_rng(seed)
+    heatmaps = (rng.random((46, 38, 4)) * rng.random((46, 38, 4)) ** 4).astype(np.float32)
+    expected = body.find_peaks(heatmaps, thre1=0.05)
+    result = torch_util.find_peaks(torch.from_numpy(heatmaps.transpose(2, 0, 1).copy()), thre1=0.05)
+    assert sum(map(len, expected)) > 0
+    assert [[peak[:2] + peak[3:] for peak in part] for part in result] == \
+        [[peak[:2] + peak[3:] for peak in part] for part in expected]
+    np.testing.assert_allclose([peak[2] for part in result for peak in part],
+                               [peak[2] for part in expected for peak in part])
+
+
+def test_resize_output_matches_cv2():
+    output = np.random.default_rng(0).standard_normal((1, 5, 23, 17)).astype(np.float32)
+    stride, padded_shape, pad, ori_shape = 8, (184, 136), [0, 0, 3, 5], (150, 101)
+    result = torch_util.resize_output(torch.from_numpy(output), stride, padded_shape, pad, ori_shape)
+    expected = np.transpose(output[0], (1, 2, 0))
+    expected = cv2.resize(expected, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
+    expected = expected[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
+    expected = cv2.resize(expected, (ori_shape[1], ori_shape[0]), interpolation=cv2.INTER_CUBIC)
+    np.testing.assert_allclose(result.numpy(), expected.transpose(2, 0, 1), atol=1e-4)
+
+
+@pytest.mark.parametrize('max_iterations', [1000, 2])
+def test_label_components_large_blob(max_iterations):
+    # a snake much longer than max_iterations steps and a separate dot
+    binary = torch.zeros((1, 21, 23), dtype=torch.bool)
+    binary[0, ::4, :20] = True
+    binary[0, 1::8, 19] = binary[0, 2::8, 19] = binary[0, 3::8, 19] = True
+    binary[0, 5::8, 0] = binary[0, 6::8, 0] = binary[0, 7::8, 0] = True
+    binary[0, 10, 22] = True
+    labels = torch_util.label_components(binary, max_iterations)[0]
+    assert labels[~binary[0]].eq(0).all()
+    assert len(torch.unique(labels[:, :20])) == 2
+    assert labels[10, 22] not in (0, labels[0, 0])
@@ -0,0 +1,24 @@
+import numpy as np
+
+from tracker import WristTracker
+
+
+def textured_frame(shift=0):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    frame = np.repeat(np.repeat(frame[::4, ::4], 4, axis=0), 4, axis=1)
+    return np.roll(frame, shift, axis=1)
+
+
+def test_tracks_confident_wrists():
+    tracker = WristTracker()
+    tracker.reset(textured_frame(), [[60, 50], [100, 70]], [0.9, 0.8])
+    points = tracker.track(textured_frame(2))
+    np.testing.assert_allclose(points, [[62, 50], [102, 70]], atol=0.5)
+
+
+def test_low_score_wrist_is_not_tracked():
+    tracker = WristTracker(min_score=0.3)
+    tracker.reset(textured_frame(), [[60, 50], [100, 70]], [0.9, 0.1])
+    assert tracker.needs_keyframe()
+    assert tracker.track(textured_frame(2)) is None
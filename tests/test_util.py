@@ -0,0 +1,130 @@
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from src import util
+from src.model import bodypose_model
+
+
+def network():
+    return nn.Sequential(OrderedDict([('block', nn.Sequential(OrderedDict([('fc', nn.Linear(3, 2))])))]))
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    # caffe converted weights are named without the block prefix
+    path = str(tmp_path / 'model.pth')
+    torch.save({'fc.weight': torch.arange(6.0).view(2, 3), 'fc.bias': torch.ones(2)}, path)
+    return path
+
+
+def test_load_weights_caches(model_path, tmp_path):
+    model = util.load_weights(network(), model_path)
+    cached = [name for name in os.listdir(str(tmp_path / 'cache')) if name.endswith('.pth')]
+    assert len(cached) == 1
+    torch.testing.assert_close(model.block.fc.weight, torch.arange(6.0).view(2, 3))
+    model = util.load_weights(network(), model_path)
+    torch.testing.assert_close(model.block.fc.bias, torch.ones(2))
+
+
+def test_load_weights_without_writable_cache(model_path, tmp_path):
+    # a file where the cache directory should be, as no directory is read-only for root
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    with pytest.warns(UserWarning, match='not caching'):
+        model = util.load_weights(network(), model_path, str(blocker / 'cache'))
+    torch.testing.assert_close(model.block.fc.weight, torch.arange(6.0).view(2, 3))
+
+
+def test_load_weights_missing_model(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        util.load_weights(network(), str(tmp_path / 'missing.pth'))
+
+
+def test_refine_peak_quadratic():
+    # samples of a parabola peaking at x = 5.3, y = 3.8
+    ys, xs = np.mgrid[0:8, 0:10]
+    array = -(xs - 5.3) ** 2 - 2 * (ys - 3.8) ** 2
+    x, y = util.refine_peak(array, [5], [4])
+    np.testing.assert_allclose([x[0], y[0]], [5.3, 3.8])
+
+
+def test_refine_peak_border():
+    array = np.zeros((6, 6))
+    array[0, 3] = array[2, 5] = 1
+    array[0, 2] = array[1, 5] = 0.5
+    x, y = util.refine_peak(array, [3, 5], [0, 2])
+    # along the border axis the peak stays, the other axis is refined
+    assert y[0] == 0 and x[1] == 5
+    assert 2.5 < x[0] < 3 and 1.5 < y[1] < 2
+
+
+def test_refine_peak_flat():
+    x, y = util.refine_peak(np.ones((5, 5)), [2], [3])
+    assert (x[0], y[0]) == (2, 3)
+
+
+def test_native_average():
+    rng = np.random.default_rng(0)
+    large = torch.from_numpy(rng.random((1, 2, 6, 5), dtype=np.float32))
+    small = torch.from_numpy(rng.random((1, 2, 3, 3), dtype=np.float32))
+    # the cells past the image are padding and dropped
+    outputs = [(torch.cat([small, torch.full((1, 2, 3, 3), 9.0)], 3), (24, 48, 3), [0, 0, 2, 29], 0.5),
+               (large, (48, 40, 3), [0, 0, 5, 3], 1.0)]
+    (average,), scale = util.native_average(outputs, 8)
+    assert scale == 1.0
+    assert average.dtype == np.float32
+    expected = (large[0].numpy().transpose(1, 2, 0) +
+                cv2.resize(small[0].numpy().transpose(1, 2, 0), (5, 6), interpolation=cv2.INTER_CUBIC)) / 2
+    np.testing.assert_allclose(average, expected, rtol=1e-6)
+
+
+def test_draw_handpose_by_opencv_float_peaks():
+    peaks = np.random.default_rng(0).uniform(1, 60, (21, 2))
+    canvas = util.draw_handpose_by_opencv(np.zeros((64, 64, 3), dtype=np.uint8), peaks)
+    assert canvas.any()
+
+
+# the preprocessing InputBuffer.fill replaced
+def fill_reference(image, stride=8, padValue=128):
+    padded, pad = util.padRightDownCorner(image, stride, padValue)
+    return np.transpose(np.float32(padded[:, :, :, np.newaxis]), (3, 2, 0, 1)) / 256 - 0.5, pad
+
+
+@pytest.mark.parametrize('size', [(37, 53), (40, 48), (9, 3)])
+def test_input_buffer_matches_reference(size):
+    image = np.random.default_rng(0).integers(0, 256, size + (3,), dtype=np.uint8)
+    data, padded_shape, (pad,) = util.InputBuffer(bodypose_model, 128).fill([image])
+    expected, expected_pad = fill_reference(image)
+    np.testing.assert_allclose(data.numpy(), expected, atol=1e-7)
+    assert pad == expected_pad
+    assert padded_shape[:2] == expected.shape[2:]
+
+
+def test_input_buffer_reuse_leaves_no_stale_pixels():
+    rng = np.random.default_rng(0)
+    inputs = util.InputBuffer(bodypose_model, 128)
+    inputs.fill([rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)] * 2)
+    # same padded size and batch, so the same buffer
+    images = [rng.integers(0, 256, size, dtype=np.uint8) for size in [(33, 35, 3), (38, 40, 3)]]
+    data, padded_shape, pads = inputs.fill(images)
+    assert len(inputs.buffers) == 1
+    for n, image in enumerate(images):
+        expected = np.full((40, 40, 3), 128, dtype=np.uint8)
+        expected[:image.shape[0], :image.shape[1]] = image
+        np.testing.assert_allclose(data[n].numpy(), np.transpose(expected, (2, 0, 1)) / 256 - 0.5, atol=1e-7)
+
+
+def test_map_accumulator_averages_in_float32():
+    accumulator = util.MapAccumulator(2)
+    buffer = accumulator.reset(3, 4)
+    accumulator.add(np.ones((3, 4, 2)))
+    accumulator.add(np.full((3, 4, 2), 2.0))
+    np.testing.assert_allclose(accumulator.average(), 1.5)
+    assert buffer.dtype == np.float32
+    assert accumulator.reset(3, 4) is buffer and not buffer.any()
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+
+# follows a few keypoints (the wrists) between two pose estimations with pyramidal
+# Lucas-Kanade optical flow. the points are tracked forward and back again, a point
+# that does not come back within max_error pixels or is lost by the flow means the
+# tracking can't be trusted and a new keyframe is needed, as does every
+# keyframe_interval-th frame so the drift stays bounded. a keyframe with a point
+# scored under min_score is not tracked at all, the next frame is a keyframe again
+class WristTracker:
+    def __init__(self, keyframe_interval=10, max_error=2.0, win_size=(21, 21), max_level=3, min_score=0.3):
+        self.keyframe_interval = keyframe_interval
+        self.max_error = max_error
+        self.min_score = min_score
+        self.lk_params = dict(
+            winSize=win_size,
+            maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+        )
+        self.gray = None
+        self.points = None
+        self.frames = 0
+
+    # start from the keypoints the pose model found on frame, points is N x 2 and
+    # scores N (None trusts every point)
+    def reset(self, frame, points, scores=None):
+        self.frames = 0
+        if scores is not None and (np.asarray(scores) < self.min_score).any():
+            self.points = None
+            return
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+
+    def needs_keyframe(self):
+        return self.points is None or len(self.points) == 0 or self.frames >= self.keyframe_interval
+
+    # the points moved to frame (N x 2), None when the tracking is lost
+    def track(self, frame):
+        if self.needs_keyframe():
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, self.points, None, **self.lk_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.gray, points, None, **self.lk_params)
+        error = np.linalg.norm((back - self.points).reshape(-1, 2), axis=1)
+        if not (status.all() and back_status.all() and (error < self.max_error).all()):
+            self.points = None
+            return None
+        self.gray = gray
+        self.points = points
+        self.frames += 1
+        return points.reshape(-1, 2)
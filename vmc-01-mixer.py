@@ -1,32 +1,66 @@
+import argparse
 import cv2
+import numpy as np
 import tkinter as tk
 from PIL import Image, ImageTk
-from mmpose.apis import init_model, inference_topdown
 from mmpose.registry import VISUALIZERS
-from mmpose.structures import merge_data_samples
 import time
 
 from player import MusicPlayer, Playlist
+from pose import TopDownPose, draw_pose
+from pipeline import LatestQueue, Stage
+from tracker import WristTracker
+from filters import WristVolumes
 import pygame
 import threading
 
-def play(mp1, mp2, stop_event):
-    mp1.set_index(2)
-    mp1.set_volume(1)
-    mp1.play()
-    mp2.set_index(1)
-    mp2.set_volume(1)
-    mp2.play()
+# players is a (right wrist, left wrist) MusicPlayer pair per performer
+def play(players, stop_event):
+    for mp1, mp2 in players:
+        mp1.set_index(2)
+        mp1.set_volume(1)
+        mp1.play()
+        mp2.set_index(1)
+        mp2.set_volume(1)
+        mp2.play()
     while not stop_event.is_set():
         time.sleep(1)
-    mp1.stop()
-    mp2.stop()
+    for mp1, mp2 in players:
+        mp1.stop()
+        mp2.stop()
     print(f"Musicplayers stopped ")
 
 
+# the camera is read by a capture thread and the pose estimated (and the volumes set)
+# by an inference thread, the Tk main thread only shows the latest drawn frame.
+# the stages are connected by LatestQueues that drop stale frames, so a slow model
+# lowers the frame rate instead of adding latency, and the UI never waits on it.
+# the pose is estimated by pose.TopDownPose: with det_config / det_checkpoint (an
+# mmdet person detector, e.g. RTMDet-tiny) every detected person is a performer
+# with their own pair of players, ordered left to right. without them HRNet runs on
+# the whole frame as a single performer.
+# with track the pose is only estimated on keyframes, in between the wrists are
+# followed by optical flow (tracker.WristTracker) until the tracking is lost or
+# keyframe_interval frames went by. wrists scored under the tracker's min_score
+# are not tracked, the pose is estimated again on the next frame.
+# the wrists of every performer set the volumes of their players through
+# filters.WristVolumes: the keypoints are smoothed by a OneEuroFilter (ignoring the
+# ones under its min_score), and a volume only reaches its player when it changed
+# by dead_band or more
 class PoseEstimation:
-    def __init__(self, config, checkpoint, device="cuda:0", fps=30):
-        self.model = init_model(config, checkpoint, device=device)
+    def __init__(self, config, checkpoint, device="cuda:0", fps=30, det_config=None,
+                 det_checkpoint=None, performers=2, bbox_thr=0.3, nms_thr=0.3,
+                 track=False, keyframe_interval=10, report_interval=100, dead_band=0.02):
+        self.pose = TopDownPose(config, checkpoint, device, det_config, det_checkpoint, bbox_thr, nms_thr)
+        self.model = self.pose.model
+        self.tracker = WristTracker(keyframe_interval) if track else None
+        # keypoints of every performer on the last pose frame, with the tracked wrists
+        self.keypoints = np.zeros((0, 17, 2))
+
+        # seconds spent on every frame, by the way it was processed
+        self.timings = {"pose": [], "tracked": []}
+        self.report_interval = report_interval
+        self.report_start = time.time()
 
         self.visualizer = VISUALIZERS.build(self.model.cfg.visualizer)
         self.visualizer.set_dataset_meta(self.model.dataset_meta)
@@ -35,23 +69,99 @@ class PoseEstimation:
 
         self.delay = int(1000 / fps)
 
+        self.stop_event = threading.Event()
+        self.frames = LatestQueue()
+        self.results = LatestQueue()
+        self.stages = [
+            Stage("capture", self.capture_frame, self.stop_event, sink=self.frames),
+            Stage("inference", self.process_frame, self.stop_event, source=self.frames, sink=self.results),
+        ]
+
         self.window = tk.Tk()
         self.window.title("Pose Estimation")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         self.image_label = tk.Label(self.window)
         self.image_label.pack()
+        # without music the poses are still shown, no volumes are set
+        self.players = []
+        self.volumes = []
         playlist = Playlist.from_folder("./music")
         if playlist and not playlist.is_empty():
-            self.p1 = MusicPlayer(playlist)
-            self.p2 = MusicPlayer(playlist)
+            performers = performers if self.pose.detector else 1
+            # MusicPlayer n plays on channel n + 1
+            pygame.mixer.init()
+            pygame.mixer.set_num_channels(max(8, 2 * performers + 1))
+            self.players = [(MusicPlayer(playlist), MusicPlayer(playlist)) for _ in range(performers)]
+            self.volumes = [WristVolumes(dead_band=dead_band) for _ in range(performers)]
         self.update_image()
 
-    def update_image(self):
+    # capture thread
+    def capture_frame(self):
         ret, frame = self.cap.read()
-        if ret:
-            results = self.estimate_pose(frame)
-            writsPos = self.extract_wrist_position(results[1])
-            self.set_volume(writsPos)
-            image = Image.fromarray(results[0])
+        if not ret:
+            time.sleep(self.delay / 1000)
+            return None
+        return time.time(), frame
+
+    # inference thread, the volumes are set here so they follow the gestures
+    # without waiting for the UI
+    def process_frame(self, item):
+        captured_at, frame = item
+        start_time = time.time()
+        tracked = self.tracker.track(frame) if self.tracker else None
+        if tracked is None:
+            mode = "pose"
+            rgb_frame, keypoints, keypoint_scores = self.estimate_pose(frame)
+            self.keypoints = np.array(keypoints[:, :, :2], dtype=np.float64)
+            if self.tracker:
+                wrists = [self.extract_wrist_position(points) for points in self.keypoints]
+                # (right, left) wrist scores per performer, like the points
+                wrist_scores = np.asarray(keypoint_scores)[:, [10, 9]]
+                self.tracker.reset(frame, np.reshape(wrists, (-1, 2)), wrist_scores.reshape(-1))
+        else:
+            mode = "tracked"
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            for x, y in tracked.astype(int):
+                cv2.circle(rgb_frame, (x, y), 6, (255, 255, 0), 2)
+            # (right, left) per performer, the order they were given to the tracker
+            self.keypoints[:, 10] = tracked[0::2]
+            self.keypoints[:, 9] = tracked[1::2]
+            keypoint_scores = None
+        for performer, players in enumerate(self.players):
+            if performer < len(self.keypoints):
+                scores = None if keypoint_scores is None else keypoint_scores[performer]
+                volumes = self.volumes[performer](self.keypoints[performer], scores, captured_at, players)
+                if volumes is not None:
+                    print(f"[Performer {performer}] p1 volume: {volumes[0]} p2 volume: {volumes[1]}")
+            else:
+                # nobody is there, mute the pair
+                self.volumes[performer].mute(players)
+        self.timings[mode].append(time.time() - start_time)
+        print(f"[{mode}] Capture to volume latency: {time.time() - captured_at:.3f} seconds "
+              f"(dropped frames: {self.frames.dropped})")
+        self.report()
+        return rgb_frame, captured_at
+
+    # frames per second and mean processing time of the pose / tracked frames over
+    # the last report_interval frames
+    def report(self):
+        frames = sum(len(times) for times in self.timings.values())
+        if frames < self.report_interval:
+            return
+        now = time.time()
+        line = f"Processed {frames / (now - self.report_start):.1f} fps"
+        for mode, times in self.timings.items():
+            if times:
+                line += f", {mode}: {len(times)} frames {1000 * sum(times) / len(times):.1f} ms"
+        print(line)
+        self.timings = {mode: [] for mode in self.timings}
+        self.report_start = now
+
+    # UI thread, shows the latest drawn frame if there is a new one
+    def update_image(self):
+        item = self.results.get(0)
+        if item is not None:
+            image = Image.fromarray(item[0])
             photo = ImageTk.PhotoImage(image)
 
             self.image_label.configure(image=photo)
@@ -59,107 +169,71 @@ class PoseEstimation:
 
         self.window.after(self.delay, self.update_image)
 
-    def set_volume(self, wrists):
-        rightWristY = wrists[0][1]
-        leftWristY = wrists[1][1]
-        p1Volume = 0 
-        p2Volume = 0
-        if rightWristY < 400 :
-            p1Volume = int((500-rightWristY)/5)/100
-        if leftWristY < 400 :
-            p2Volume = int((500-leftWristY)/5)/100
-        print(f"[Right Y: {rightWristY}] p1 volume: {p1Volume} ")
-        print(f"[Left Y: {leftWristY}] p2 volume: {p2Volume} ")
-        self.p1.set_volume(p1Volume)
-        self.p2.set_volume(p2Volume)
-        
-
     def extract_wrist_position(self, points):
         right_wrist = int(points[10][0]), int(points[10][1])
         left_wrist = int(points[9][0]), int(points[9][1])
         return [right_wrist, left_wrist]
 
+    # returns the drawn frame and the keypoints / keypoint scores of every performer
     def estimate_pose(self, frame):
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
         start_time = time.time()
-        batch_results = inference_topdown(self.model, rgb_frame)
-        result = merge_data_samples(batch_results)  # Assuming single frame
-
+        keypoints, keypoint_scores = self.pose(frame, rgb_frame, len(self.players) or None)
         end_time = time.time()
 
         elapsed_time = end_time - start_time
 
         print(f"Elapsed time: {elapsed_time} seconds")
-        pred_instances = result.pred_instances
-        keypoints = pred_instances.keypoints[0]  # Assuming single person in the frame
-        keypoint_scores = pred_instances.keypoint_scores[0]  # Key point scores
-
-        #print("KEYPOINTS: " + str(keypoints))
-        #print("SCORE: " + str(keypoint_scores))
-        # Skeleton connections for COCO keypoints
-        skeleton = [
-            (0, 1),
-            (0, 2),
-            (1, 3),
-            (2, 4),  # Head to shoulders
-            (5, 6),
-            (5, 11),
-            (6, 12),
-            (11, 12),  # Torso
-            (5, 7),
-            (7, 9),
-            (6, 8),
-            (8, 10),  # Arms
-            (11, 13),
-            (13, 15),
-            (12, 14),
-            (14, 16),  # Legs
-        ]
-
-        for idx, (x, y) in enumerate(keypoints[:, :2]):
-            conf = keypoint_scores[idx]
-            if conf > 0.3:  # Confidence threshold
-                cv2.circle(rgb_frame, (int(x), int(y)), 3, (0, 255, 0), -1)
-
-        for start, end in skeleton:
-            if keypoint_scores[start] > 0.3 and keypoint_scores[end] > 0.3:
-                cv2.line(
-                    rgb_frame,
-                    (int(keypoints[start][0]), int(keypoints[start][1])),
-                    (int(keypoints[end][0]), int(keypoints[end][1])),
-                    (255, 0, 0),
-                    2,
-                )
+        for person_keypoints, person_scores in zip(keypoints, keypoint_scores):
+            draw_pose(rgb_frame, person_keypoints, person_scores)
         # visualized_image_bgr = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
         return [ rgb_frame, keypoints, keypoint_scores]
 
     def run(self):
-        stop_event = threading.Event() # used to signal termination to the threads
-
         print(f"Starting musicplayer thread...")   
-        music_thread = threading.Thread(target=play, args=(self.p1, self.p2, stop_event))
+        music_thread = threading.Thread(target=play, args=(self.players, self.stop_event))
         music_thread.start()
         print(f"Done musicplayer.")
 
-        print(f"Starting mainloop on main thread...")
-        self.window.mainloop()
-        print(f"Done. mainloop")
+        print(f"Starting capture and inference threads...")
+        for stage in self.stages:
+            stage.start()
 
+        print(f"Starting mainloop on main thread...")
         try:
-            while True:
-                time.sleep(10)
+            self.window.mainloop()
         except (KeyboardInterrupt, SystemExit):
-            # stop the music. 
-            stop_event.set()
+            pass
+        print(f"Done. mainloop")
+
+        # stop the capture, the inference and the music
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join()
+        music_thread.join()
+
+    def close(self):
+        self.stop_event.set()
+        self.window.destroy()
 
     def __del__(self):
         self.cap.release()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--det-config", help="mmdet person detector config, enables several performers")
+    parser.add_argument("--det-checkpoint", help="mmdet person detector checkpoint")
+    parser.add_argument("--performers", type=int, default=2, help="performers tracked with a detector")
+    parser.add_argument("--track", action="store_true", help="track the wrists between keyframes")
+    parser.add_argument("--keyframe-interval", type=int, default=10, help="frames between pose estimations")
+    args = parser.parse_args()
+
     config = "td-hm_hrnet-w48_8xb32-210e_coco-256x192.py"
     checkpoint = "td-hm_hrnet-w48_8xb32-210e_coco-256x192-0e67c616_20220913.pth"
 
-    app = PoseEstimation(config, checkpoint, fps=30)
+    app = PoseEstimation(config, checkpoint, fps=30, det_config=args.det_config,
+                         det_checkpoint=args.det_checkpoint, performers=args.performers,
+                         track=args.track, keyframe_interval=args.keyframe_interval)
     app.run()